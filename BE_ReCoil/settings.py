@@ -15,6 +15,7 @@ from datetime import timedelta
 import os
 from dotenv import load_dotenv
 import dj_database_url
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -75,6 +76,8 @@ MIDDLEWARE = [
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed']
 
 ROOT_URLCONF = 'BE_ReCoil.urls'
 
@@ -131,6 +134,19 @@ else:
 # }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Kept in the database so every process sees the same entries (e.g. the feed versions
+# bumped by invalidate_feed); main's migrations create the table
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -229,3 +245,30 @@ AWS_QUERYSTRING_AUTH = False  # karena sekarang public
 
 AWS_S3_CUSTOM_DOMAIN = f"{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com"
 MEDIA_URL = f"https://{AWS_S3_CUSTOM_DOMAIN}/"
+
+# Uploaded photos wait in local scratch until a background worker has stored them
+IMAGE_SCRATCH_DIR = os.getenv('IMAGE_SCRATCH_DIR', str(BASE_DIR / 'scratch' / 'uploads'))
+IMAGE_UPLOAD_WORKERS = int(os.getenv('IMAGE_UPLOAD_WORKERS', '4'))
+IMAGE_UPLOAD_ATTEMPTS = 3
+
+# Presigned direct-to-storage uploads; 'local' is a filesystem stand-in for offline development
+DIRECT_UPLOAD_BACKEND = os.getenv('DIRECT_UPLOAD_BACKEND', 's3' if AWS_STORAGE_BUCKET_NAME else 'local')
+DIRECT_UPLOAD_ROOT = os.getenv('DIRECT_UPLOAD_ROOT', str(BASE_DIR / 'scratch' / 'direct'))
+DIRECT_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+DIRECT_UPLOAD_EXPIRY = 15 * 60  # seconds
+
+# How long adding an item to a cart holds its units for that cart; refreshed by every cart change
+CART_RESERVATION_TTL = 15 * 60  # seconds
+
+# How long the response to a request with an Idempotency-Key is kept for replaying to its retries
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60  # seconds
+
+# Server-Sent Event streams send a comment this often to keep idle connections open, and end
+# after SSE_MAX_DURATION so workers are recycled; clients reconnect with Last-Event-ID
+SSE_HEARTBEAT = 15  # seconds
+SSE_MAX_DURATION = 5 * 60  # seconds
+# An open stream holds a worker thread for its whole life, so streams need a threaded server
+# (runserver, or gunicorn --worker-class gthread / gevent; a sync worker serves nothing else
+# while streaming). Each process refuses new streams with 503 past SSE_MAX_STREAMS; keep it
+# below the threads per worker so ordinary requests still get one.
+SSE_MAX_STREAMS = int(os.getenv('SSE_MAX_STREAMS', 32))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community', '0004_alter_blog_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='image_variants',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
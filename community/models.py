@@ -1,4 +1,5 @@
 from django.db import models
+from main.images import IMAGE_STATUS_CHOICES
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -9,6 +10,11 @@ class Blog(models.Model):
     title = models.CharField(max_length=255)
     body = models.TextField()
     image = models.ImageField(null=True, blank=True)
+    # Names of the resized copies of image, keyed by size (see main.images)
+    image_variants = models.JSONField(null=True, blank=True)
+    # A new photo waits in local scratch (image_pending) until main.uploads has stored it
+    image_status = models.CharField(max_length=10, choices=IMAGE_STATUS_CHOICES, default='ready')
+    image_pending = models.CharField(max_length=255, blank=True)
 
 
     def __str__(self):
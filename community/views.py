@@ -11,9 +11,12 @@ from rest_framework.decorators import parser_classes
 from django.conf import settings
 import logging
 import os
-from storages.backends.s3boto3 import S3Boto3Storage
+from main.images import image_urls
+from main.uploads import enqueue_image, stage_image
 from django.core.files.base import ContentFile
 from django.db import transaction
+from django.db.models import Count
+from main.streaming import streaming_json_response
 
 
 # Create your views here.
@@ -22,20 +25,18 @@ from django.db import transaction
 @permission_classes([AllowAny])
 @csrf_exempt
 def get_all_blogs(request):
-    blogs = Blog.objects.all().order_by('-date_added')
-    data = [
-        {
-            'id': blog.id,
-            'username': blog.user.username,
-            'date_added': blog.date_added,
-            'title': blog.title,
-            'body': blog.body,
-            'thumbs_up_count': blog.thumbs_ups.count(),
-            'image_url': blog.image.url if blog.image else None,
-        }
-        for blog in blogs
-    ]
-    return JsonResponse({'blogs': data})
+    blogs = Blog.objects.select_related('user').annotate(thumbs_up_total=Count('thumbs_ups')).order_by('-date_added')
+    return streaming_json_response('blogs', blogs, lambda blog: {
+        'id': blog.id,
+        'username': blog.user.username,
+        'date_added': blog.date_added,
+        'title': blog.title,
+        'body': blog.body,
+        'thumbs_up_count': blog.thumbs_up_total,
+        'image_url': blog.image.url if blog.image else None,
+        'image_urls': image_urls(blog),
+        'image_status': blog.image_status,
+    })
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
@@ -51,6 +52,8 @@ def get_blog_details(request, blog_id):
             'body': blog.body,
             'thumbs_up_count': blog.thumbs_ups.count(),
             'image_url': blog.image.url if blog.image else None,
+            'image_urls': image_urls(blog),
+            'image_status': blog.image_status,
         }
         return JsonResponse({'blog': data})
     except Blog.DoesNotExist:
@@ -90,14 +93,16 @@ def create_blog(request):
     blog = Blog(user=request.user, title=title, body=body)
 
     if image:
-        storage = S3Boto3Storage()
-        key = f"photos/{image.name}"
-        saved_name = storage.save(key, image)
-        blog.image.name = saved_name
+        try:
+            stage_image(blog, image)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid image.'}, status=400)
 
     blog.save()
+    if image:
+        enqueue_image(blog)
 
-    return JsonResponse({'message': 'Blog created successfully.', 'blog_id': blog.id})
+    return JsonResponse({'message': 'Blog created successfully.', 'blog_id': blog.id, 'image_status': blog.image_status})
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -119,13 +124,15 @@ def edit_blog(request, blog_id):
     if body:
         blog.body  = body
     if image:
-        storage = S3Boto3Storage()
-        key = f"photos/{image.name}"
-        saved_name = storage.save(key, image)
-        blog.image.name = saved_name
+        try:
+            stage_image(blog, image)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid image.'}, status=400)
 
     blog.save()
-    return JsonResponse({'message': 'Blog updated successfully.'})
+    if image:
+        enqueue_image(blog)
+    return JsonResponse({'message': 'Blog updated successfully.', 'image_status': blog.image_status})
 
 
 @api_view(['DELETE'])
@@ -181,20 +188,16 @@ def thumbs_up_blog(request, blog_id):
 @csrf_exempt
 def get_all_qna(request):
     from .models import Question
-    questions = Question.objects.all().order_by('-date_added')
-    data = [
-        {
-            'id': q.id,
-            'username': q.user.username,
-            'date_added': q.date_added,
-            'title': q.title,
-            'body': q.body,
-            'category': q.category,
-            'status': q.status,
-        }
-        for q in questions
-    ]
-    return JsonResponse({'questions': data})
+    questions = Question.objects.select_related('user').order_by('-date_added')
+    return streaming_json_response('questions', questions, lambda q: {
+        'id': q.id,
+        'username': q.user.username,
+        'date_added': q.date_added,
+        'title': q.title,
+        'body': q.body,
+        'category': q.category,
+        'status': q.status,
+    })
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -0,0 +1,115 @@
+import threading
+import uuid
+import numpy as np
+from django.core.cache import cache
+from main.geo import encode_geohash
+from main.images import image_urls
+from .models import Item
+
+# Snapshots built by this process, keyed by viewer role ('agent' or 'member')
+_snapshots = {}
+_rebuild_locks = {'agent': threading.Lock(), 'member': threading.Lock()}
+
+def viewer_role(is_agent):
+    return 'agent' if is_agent else 'member'
+
+def counterpart_seller_type(is_agent):
+    """Seller type a viewer buys from: agents buy from members, members from agents"""
+    return 'member' if is_agent else 'agent'
+
+def marketplace_items(is_agent):
+    """
+    Return the available items a viewer can see (agents see member items, members see agent items),
+    filtered on the denormalized seller columns so no join is needed.
+    """
+    return Item.objects.filter(
+        seller_type=counterpart_seller_type(is_agent),
+        status='available',
+        seller_latitude__isnull=False,
+        seller_longitude__isnull=False
+    )
+
+def serialize_feed_item(item):
+    """Marketplace payload of an item, without the viewer-specific distance"""
+    data = {
+        "id": item.id,
+        "name": item.name,
+        "description": item.description,
+        "price": float(item.price),
+        "stock": item.stock,
+    }
+    if item.seller_type == 'member':
+        data["member_id"] = item.member_id
+        data["member_name"] = item.seller_name
+    else:
+        data["agent_id"] = item.agent_id
+        data["agent_name"] = item.seller_name
+    data.update({
+        "category": item.category,
+        "unit": item.unit,
+        "created_at": item.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "image_url": item.image.url if item.image else None,
+        "image_urls": image_urls(item),
+        "image_status": item.image_status,
+    })
+    return data
+
+class FeedSnapshot:
+    """
+    The marketplace candidate set of one viewer role: compact arrays of item ids
+    and seller coordinates sorted by seller geohash, plus pre-serialized payloads.
+    Only the distance ordering differs between viewers of the same role.
+    """
+
+    def __init__(self, version, is_agent):
+        self.version = version
+        rows = []
+        self.payloads = {}
+        for item in marketplace_items(is_agent).iterator(chunk_size=2000):
+            geohash = item.seller_geohash or encode_geohash(item.seller_latitude, item.seller_longitude)
+            rows.append((geohash, item.id, item.seller_latitude, item.seller_longitude))
+            self.payloads[item.id] = serialize_feed_item(item)
+        rows.sort()
+
+        self.geohashes = np.array([row[0] for row in rows], dtype=str)
+        self.ids = np.array([row[1] for row in rows], dtype=np.int64)
+        self.lats = np.array([row[2] for row in rows], dtype=np.float64)
+        self.lons = np.array([row[3] for row in rows], dtype=np.float64)
+
+    def candidates(self, cells):
+        """Rows whose seller lies in the given geohash cells, for main.geo.nearest()"""
+        if cells is None:
+            return self.ids, self.lats, self.lons
+        # '~' sorts after every geohash character, so [cell, cell + '~') is the cell's prefix range
+        index = np.concatenate([
+            np.arange(*np.searchsorted(self.geohashes, [cell, cell + '~']))
+            for cell in cells
+        ])
+        return self.ids[index], self.lats[index], self.lons[index]
+
+    def payload(self, item_id, distance):
+        return {**self.payloads[item_id], "distance_km": round(distance, 2) if distance is not None else None}
+
+def _version_key(role):
+    return f'item:feed:{role}:version'
+
+def get_feed_snapshot(is_agent):
+    """Return the current snapshot for the viewer's role, rebuilding it at most once when it is stale"""
+    role = viewer_role(is_agent)
+    version = cache.get_or_set(_version_key(role), lambda: uuid.uuid4().hex, None)
+    snapshot = _snapshots.get(role)
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    # Concurrent requests wait for the one rebuild instead of each running their own
+    with _rebuild_locks[role]:
+        snapshot = _snapshots.get(role)
+        if snapshot is None or snapshot.version != version:
+            snapshot = FeedSnapshot(version, is_agent)
+            _snapshots[role] = snapshot
+    return snapshot
+
+def invalidate_feed(*roles):
+    """Mark the snapshots of the given viewer roles as stale (in every process sharing the cache)"""
+    for role in roles:
+        cache.set(_version_key(role), uuid.uuid4().hex, None)
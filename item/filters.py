@@ -0,0 +1,93 @@
+from decimal import Decimal, InvalidOperation
+from django.db.models import Case, Count, F, Q, Value, When
+from main.geo import bounding_box
+from .models import Item
+
+PRICE_BUCKETS = [0, 1000, 5000, 10000, 50000, 100000]
+
+def price_bucket_labels():
+    labels = [f"{lower}-{upper}" for lower, upper in zip(PRICE_BUCKETS, PRICE_BUCKETS[1:])]
+    return labels + [f"{PRICE_BUCKETS[-1]}+"]
+
+def price_bucket():
+    """SQL expression labelling each item with its price bucket"""
+    labels = price_bucket_labels()
+    return Case(
+        *[When(price__lt=upper, then=Value(label)) for upper, label in zip(PRICE_BUCKETS[1:], labels)],
+        default=Value(labels[-1]),
+    )
+
+FACETS = {
+    'category': F('category'),
+    'price': price_bucket(),
+    'unit': F('unit'),
+    'status': F('status'),
+    'seller_type': F('seller_type'),
+}
+
+def parse_filters(params):
+    """
+    Build {facet: Q} from the catalog filter query parameters.
+    category, unit, status and seller_type may be repeated; min_price/max_price bound the price.
+    Raises ValueError on invalid values.
+    """
+    filters = {}
+    for facet in ('category', 'unit'):
+        values = [value for value in params.getlist(facet) if value]
+        if values:
+            filters[facet] = Q(**{f'{facet}__in': values})
+
+    statuses = [value for value in params.getlist('status') if value]
+    if statuses:
+        if not set(statuses) <= {choice for choice, _ in Item.STATUS_CHOICES}:
+            raise ValueError('Invalid status')
+        filters['status'] = Q(status__in=statuses)
+
+    seller_types = [value for value in params.getlist('seller_type') if value]
+    if seller_types:
+        if not set(seller_types) <= {choice for choice, _ in Item.SELLER_TYPE_CHOICES}:
+            raise ValueError('Invalid seller_type')
+        filters['seller_type'] = Q(seller_type__in=seller_types)
+
+    price = Q()
+    for param, lookup in (('min_price', 'price__gte'), ('max_price', 'price__lte')):
+        if params.get(param):
+            try:
+                bound = Decimal(params[param])
+            except InvalidOperation:
+                raise ValueError('Invalid price')
+            # Decimal also parses nan and inf, which no price can be compared with
+            if not bound.is_finite():
+                raise ValueError('Invalid price')
+            price &= Q(**{lookup: bound})
+    if price:
+        filters['price'] = price
+
+    return filters
+
+def near(lat, lon, radius):
+    """Database-side approximation of a radius: the seller lies in its bounding box"""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius)
+    q = Q(seller_latitude__gte=min_lat, seller_latitude__lte=max_lat)
+    if min_lon is not None:
+        q &= Q(seller_longitude__gte=min_lon, seller_longitude__lte=max_lon)
+    return q
+
+def facet_counts(items, filters):
+    """
+    Count items per value of every facet with one GROUP BY each.
+    Each facet applies every filter except its own, so clients can see the
+    alternatives to what they already selected.
+    """
+    counts = {}
+    for facet, expression in FACETS.items():
+        rows = (
+            items.filter(*[q for name, q in filters.items() if name != facet])
+            .annotate(value=expression)
+            .values('value')
+            .annotate(count=Count('id'))
+            .order_by('value')
+        )
+        counts[facet] = {row['value']: row['count'] for row in rows}
+    counts['price'] = {label: counts['price'].get(label, 0) for label in price_bucket_labels()}
+    return counts
@@ -0,0 +1,107 @@
+import csv
+import io
+import json
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from .feed import invalidate_feed, viewer_role
+from .models import Item
+
+IMPORT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+# Column names as accepted by add_item, and the Item field each one fills
+IMPORT_COLUMNS = {
+    'product_title': 'name',
+    'description': 'description',
+    'price': 'price',
+    'quantity': 'stock',
+    'waste_category': 'category',
+    'unit': 'unit',
+    'status': 'status',
+    'location': 'location',
+}
+REQUIRED_COLUMNS = ('product_title', 'quantity', 'waste_category')
+
+def read_rows(upload, fmt):
+    """
+    Yield (row number, row) from a CSV (with a header line) or JSON Lines upload,
+    decoding it as a stream. Unparseable JSON lines are yielded as a ValueError.
+    """
+    text = io.TextIOWrapper(upload, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, ValueError('Invalid JSON')
+            continue
+        yield number, row if isinstance(row, dict) else ValueError('Each line must be a JSON object')
+
+def build_item(row, agent):
+    """Validate one row's fields (without touching the database) and return the unsaved Item"""
+    if isinstance(row, ValueError):
+        raise ValidationError({'row': [str(row)]})
+    missing = {column: ['This field is required.'] for column in REQUIRED_COLUMNS if row.get(column) in (None, '')}
+    if missing:
+        raise ValidationError(missing)
+
+    values = {field: row[column] for column, field in IMPORT_COLUMNS.items() if row.get(column) not in (None, '')}
+    # Like add_item, price is optional
+    values.setdefault('price', 0)
+    item = Item(agent=agent, **values)
+    item.description = item.description or ''
+    try:
+        item.clean_fields(exclude=[field.name for field in Item._meta.fields if field.name not in values])
+    except ValidationError as e:
+        # Report the problem under the column name the client sent
+        columns = {field: column for column, field in IMPORT_COLUMNS.items()}
+        raise ValidationError({columns.get(field, field): messages for field, messages in e.message_dict.items()})
+    if item.price < 0 or item.stock < 0:
+        raise ValidationError({'price' if item.price < 0 else 'quantity': ['Must not be negative.']})
+    return item
+
+def import_items(upload, fmt, agent):
+    """
+    Create the agent's items from an uploaded CSV / JSON Lines file.
+    Rows are validated one by one and inserted IMPORT_BATCH_SIZE at a time; invalid rows are
+    skipped and reported as {row, errors}. Returns the report.
+    """
+    created, errors, error_count = [], [], 0
+
+    def report(number, messages):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'row': number, 'errors': messages})
+
+    def flush(batch):
+        items = [item for _, item in batch]
+        invalid = set(Item.prepare_bulk(items))
+        for index in sorted(invalid):
+            report(batch[index][0], {'seller': ['Item must have exactly one seller (either agent or member).']})
+        items = [item for index, item in enumerate(items) if index not in invalid]
+        with transaction.atomic():
+            created.extend(item.id for item in Item.objects.bulk_create(items))
+        batch.clear()
+
+    batch = []
+    for number, row in read_rows(upload, fmt):
+        try:
+            batch.append((number, build_item(row, agent)))
+        except ValidationError as e:
+            report(number, e.message_dict)
+        if len(batch) == IMPORT_BATCH_SIZE:
+            flush(batch)
+    if batch:
+        flush(batch)
+
+    if created:
+        # bulk_create sends no post_save, so refresh the marketplace feed of the buyers here
+        invalidate_feed(viewer_role(is_agent=False))
+    return {'created': len(created), 'item_ids': created, 'error_count': error_count, 'errors': errors}
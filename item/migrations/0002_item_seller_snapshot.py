@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:06
+
+from django.db import migrations, models
+
+
+def populate_seller_snapshot(apps, schema_editor):
+    Item = apps.get_model('item', 'Item')
+    items = Item.objects.select_related('member', 'agent__user')
+    for item in items.iterator():
+        seller = item.agent.user if item.agent_id else item.member
+        item.seller_type = 'agent' if item.agent_id else 'member'
+        item.seller_name = seller.username
+        item.seller_latitude = seller.latitude
+        item.seller_longitude = seller.longitude
+        item.seller_geohash = seller.geohash
+        item.save(update_fields=['seller_type', 'seller_name', 'seller_latitude', 'seller_longitude', 'seller_geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0001_initial'),
+        ('member', '0003_member_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='seller_geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='seller_latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='seller_longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='seller_name',
+            field=models.CharField(blank=True, max_length=150),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='seller_type',
+            field=models.CharField(blank=True, choices=[('agent', 'Agent'), ('member', 'Member')], max_length=10),
+        ),
+        migrations.RunPython(populate_seller_snapshot, migrations.RunPython.noop),
+    ]
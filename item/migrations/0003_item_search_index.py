@@ -0,0 +1,14 @@
+from django.db import migrations
+
+from item.search import drop_search_index, install_search_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0002_item_seller_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, drop_search_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+from item.search import install_search_index
+
+
+def populate_updated_at(apps, schema_editor):
+    Item = apps.get_model('item', 'Item')
+    Item.objects.update(updated_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0001_initial'),
+        ('item', '0003_item_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(populate_updated_at, migrations.RunPython.noop),
+        # Adding the column rebuilds item_item on SQLite, which drops the search triggers
+        migrations.RunPython(install_search_index, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['agent', 'updated_at'], name='item_item_agent_i_84b5e8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['member', 'updated_at'], name='item_item_member__837921_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:15
+
+from django.db import migrations, models
+
+from item.search import install_search_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0005_item_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='image_pending',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='image_status',
+            field=models.CharField(choices=[('ready', 'Ready'), ('pending', 'Pending'), ('failed', 'Failed')], default='ready', max_length=10),
+        ),
+        # Adding the columns rebuilds item_item on SQLite, which drops the search triggers
+        migrations.RunPython(install_search_index, migrations.RunPython.noop),
+    ]
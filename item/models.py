@@ -1,4 +1,5 @@
 from django.db import models
+from main.images import IMAGE_STATUS_CHOICES
 from django.core.exceptions import ValidationError
 from agent.models import Agent
 from member.models import Member
@@ -9,6 +10,10 @@ class Item(models.Model):
         ('pending', 'Pending'),
         ('sold', 'Sold'),
     ]
+    SELLER_TYPE_CHOICES = [
+        ('agent', 'Agent'),
+        ('member', 'Member'),
+    ]
     
     name = models.CharField(max_length=255)
     description = models.TextField()
@@ -19,6 +24,13 @@ class Item(models.Model):
     agent = models.ForeignKey(Agent, on_delete=models.CASCADE, null=True, blank=True)
     member = models.ForeignKey(Member, on_delete=models.CASCADE, null=True, blank=True)
     
+    # Denormalized copy of the seller, so listings render without joining member/agent/user
+    seller_type = models.CharField(max_length=10, choices=SELLER_TYPE_CHOICES, blank=True)
+    seller_name = models.CharField(max_length=150, blank=True)
+    seller_latitude = models.FloatField(null=True, blank=True)
+    seller_longitude = models.FloatField(null=True, blank=True)
+    seller_geohash = models.CharField(max_length=12, blank=True, null=True, db_index=True)
+    
     category = models.CharField(max_length=100)
     unit = models.CharField(max_length=20, default='L')
     
@@ -26,7 +38,22 @@ class Item(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='available')
     location = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Validator for conditional GETs (see views). auto_now only applies to save(): callers of
+    # queryset.update() / bulk_update() must set updated_at themselves or clients keep getting 304
+    updated_at = models.DateTimeField(auto_now=True)
     image = models.ImageField(null=True, blank=True)
+    # Names of the resized copies of image, keyed by size (see main.images)
+    image_variants = models.JSONField(null=True, blank=True)
+    # A new photo waits in local scratch (image_pending) until main.uploads has stored it
+    image_status = models.CharField(max_length=10, choices=IMAGE_STATUS_CHOICES, default='ready')
+    image_pending = models.CharField(max_length=255, blank=True)
+    
+    class Meta:
+        # A seller's latest change is read straight from the index by the my_items conditional GET
+        indexes = [
+            models.Index(fields=['agent', 'updated_at']),
+            models.Index(fields=['member', 'updated_at']),
+        ]
     
     def clean(self):
         """Ensure item has exactly one seller (agent XOR member)"""
@@ -35,13 +62,54 @@ class Item(models.Model):
             
     def save(self, *args, **kwargs):
         self.clean()
+        if kwargs.get('update_fields') is None:
+            self.refresh_seller()
+        else:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'updated_at'}
         super().save(*args, **kwargs)
+    
+    @classmethod
+    def prepare_bulk(cls, items):
+        """
+        What save() does per instance, for a batch about to be bulk_create()d:
+        returns the indices of the items failing clean()'s seller check and copies the
+        seller snapshot onto the others, reading each distinct seller only once.
+        """
+        invalid = []
+        snapshots = {}
+        for index, item in enumerate(items):
+            if (item.agent_id is None) == (item.member_id is None):
+                invalid.append(index)
+                continue
+            seller = ('agent', item.agent_id) if item.agent_id else ('member', item.member_id)
+            if seller not in snapshots:
+                item.refresh_seller()
+                snapshots[seller] = {field: getattr(item, field) for field in ('seller_type', 'seller_name', 'seller_latitude', 'seller_longitude', 'seller_geohash')}
+            else:
+                for field, value in snapshots[seller].items():
+                    setattr(item, field, value)
+        return invalid
         
     def get_seller(self):
         """Return the seller (agent or member) of this item"""
         return self.agent if self.agent else self.member
     
+    @staticmethod
+    def seller_fields(user):
+        """Denormalized seller columns for the seller's member account"""
+        return {
+            'seller_name': user.username,
+            'seller_latitude': user.latitude,
+            'seller_longitude': user.longitude,
+            'seller_geohash': user.geohash,
+        }
+    
+    def refresh_seller(self):
+        """Copy the seller's type, name and location onto the item"""
+        self.seller_type = 'agent' if self.agent else 'member'
+        user = self.agent.user if self.agent else self.member
+        for field, value in self.seller_fields(user).items():
+            setattr(self, field, value)
+    
     def __str__(self):
-        seller = self.get_seller()
-        seller_name = seller.username if self.member else seller.user.username
-        return f"{self.name} (Sold by: {seller_name})"
\ No newline at end of file
+        return f"{self.name} (Sold by: {self.seller_name})"
\ No newline at end of file
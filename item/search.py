@@ -0,0 +1,136 @@
+import re
+import numpy as np
+from django.db import connection
+from main.geo import haversine_many, neighbor_cells, precision_for_radius
+
+# Full-text index over Item name, category and description.
+# SQLite (dev) uses an FTS5 table kept in sync by triggers; PostgreSQL uses a
+# generated tsvector column with a GIN index. Both follow every write to item_item.
+
+SQLITE_SEARCH_INDEX = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS item_item_fts USING fts5(
+        name, category, description,
+        content='item_item', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS item_item_fts_insert AFTER INSERT ON item_item BEGIN
+        INSERT INTO item_item_fts(rowid, name, category, description)
+        VALUES (new.id, new.name, new.category, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS item_item_fts_delete AFTER DELETE ON item_item BEGIN
+        INSERT INTO item_item_fts(item_item_fts, rowid, name, category, description)
+        VALUES ('delete', old.id, old.name, old.category, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS item_item_fts_update AFTER UPDATE OF name, category, description ON item_item BEGIN
+        INSERT INTO item_item_fts(item_item_fts, rowid, name, category, description)
+        VALUES ('delete', old.id, old.name, old.category, old.description);
+        INSERT INTO item_item_fts(rowid, name, category, description)
+        VALUES (new.id, new.name, new.category, new.description);
+    END""",
+    "INSERT INTO item_item_fts(item_item_fts) VALUES ('rebuild')",
+]
+
+POSTGRES_SEARCH_INDEX = [
+    """ALTER TABLE item_item ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(category, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS item_item_search_vector_idx ON item_item USING GIN (search_vector)",
+]
+
+def install_search_index(apps, schema_editor):
+    """
+    Create the search index for the current database (idempotent).
+
+    SQLite drops triggers when Django rebuilds a table, so migrations that
+    alter item_item re-run this afterwards.
+    """
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_SEARCH_INDEX, 'postgresql': POSTGRES_SEARCH_INDEX}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS item_item_fts")
+    elif vendor == 'postgresql':
+        schema_editor.execute("ALTER TABLE item_item DROP COLUMN IF EXISTS search_vector")
+
+def search_terms(query):
+    """Split a user query into at most 10 plain word tokens (no search operators)"""
+    return re.findall(r'\w+', query.lower())[:10]
+
+def search_items(query, seller_type, limit, lat=None, lon=None, radius=None, available=None):
+    """
+    Return up to limit (item_id, score, distance_km) for the available items of seller_type
+    matching every term of query (as a prefix), best match first and nearest first on ties.
+
+    The database ranks and limits the matches. More rows are read, in growing batches, only
+    while the radius or available (a container of the item ids that may be returned) turn
+    rows away, or while a location is given and the last row's score may have ties left
+    to order by distance. With a radius, only sellers in the geohash cells covering it are
+    matched and the exact distance is checked afterwards.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    where = ["item_item.seller_type = %s", "item_item.status = 'available'", "item_item.seller_latitude IS NOT NULL", "item_item.seller_longitude IS NOT NULL"]
+    params = [seller_type]
+    precision = precision_for_radius(lat, radius) if radius is not None else 0
+    if precision:
+        cells = sorted(neighbor_cells(lat, lon, precision))
+        where.append("(" + " OR ".join(["item_item.seller_geohash LIKE %s"] * len(cells)) + ")")
+        params += [f"{cell}%" for cell in cells]
+
+    if connection.vendor == 'postgresql':
+        sql = f"""
+            SELECT item_item.id, ts_rank_cd(item_item.search_vector, query) AS score,
+                   item_item.seller_latitude, item_item.seller_longitude
+            FROM item_item, to_tsquery('simple', %s) query
+            WHERE item_item.search_vector @@ query AND {' AND '.join(where)}
+            ORDER BY score DESC, item_item.id LIMIT %s OFFSET %s
+        """
+        params = [' & '.join(f"{term}:*" for term in terms)] + params
+    else:
+        # bm25() is lower for better matches; weight name over category over description
+        sql = f"""
+            SELECT item_item.id, -bm25(item_item_fts, 10.0, 5.0, 1.0) AS score,
+                   item_item.seller_latitude, item_item.seller_longitude
+            FROM item_item_fts JOIN item_item ON item_item.id = item_item_fts.rowid
+            WHERE item_item_fts MATCH %s AND {' AND '.join(where)}
+            ORDER BY score DESC, item_item.id LIMIT %s OFFSET %s
+        """
+        params = [' '.join(f'"{term}"*' for term in terms)] + params
+
+    located = lat is not None and lon is not None
+    batch = limit if available is None and radius is None and not located else 2 * limit
+    rows = np.empty((0, 4))
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute(sql, params + [batch, len(rows)])
+            fetched = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, 4)
+            rows = np.concatenate([rows, fetched])
+            ids, scores = rows[:, 0].astype(np.int64), rows[:, 1]
+            distances = haversine_many(lat, lon, rows[:, 2], rows[:, 3]) if located else None
+
+            keep = np.ones(len(rows), dtype=bool)
+            if available is not None:
+                keep &= np.fromiter((int(item_id) in available for item_id in ids), dtype=bool, count=len(ids))
+            if radius is not None:
+                keep &= distances <= radius
+            if len(fetched) < batch:
+                break
+            # Rows scoring above the last one have all their ties in hand
+            settled = scores > scores[-1] if located else keep
+            if np.count_nonzero(keep & settled) >= limit:
+                break
+            batch *= 2
+
+    ids, scores = ids[keep], scores[keep]
+    if not located:
+        return [(int(item_id), float(score), None) for item_id, score in zip(ids[:limit], scores[:limit])]
+    distances = distances[keep]
+    order = np.lexsort((ids, distances, -scores))[:limit]
+    return [(int(ids[i]), float(scores[i]), float(distances[i])) for i in order]
@@ -0,0 +1,41 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from agent.models import Agent
+from member.models import Member
+from .feed import invalidate_feed
+from .models import Item
+
+def _invalidate_on_commit(*roles):
+    # Wait for the commit so a concurrent rebuild can't cache the old rows under the new version
+    transaction.on_commit(partial(invalidate_feed, *roles))
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_feed_for_item(sender, instance, **kwargs):
+    """Member items are shown to agents, agent items to members"""
+    _invalidate_on_commit('agent' if instance.member_id else 'member')
+
+@receiver(post_save, sender=Member)
+def sync_seller_of_member(sender, instance, created, update_fields=None, **kwargs):
+    """Copy a seller's new name or location onto their items (as member and as agent)"""
+    seller_fields = {'username', 'latitude', 'longitude'}
+    if created or (update_fields is not None and not seller_fields & set(update_fields)):
+        return
+    if instance.has_changed(*seller_fields):
+        fields = Item.seller_fields(instance)
+        stale = Item.objects.exclude(**fields)
+        if stale.filter(member=instance).update(**fields, updated_at=timezone.now()):
+            _invalidate_on_commit('agent')
+        if stale.filter(agent__user=instance).update(**fields, updated_at=timezone.now()):
+            _invalidate_on_commit('member')
+
+@receiver(post_save, sender=Agent)
+def sync_seller_of_agent(sender, instance, created, **kwargs):
+    """An agent's items are listed under the agent's member account"""
+    if not created:
+        fields = Item.seller_fields(instance.user)
+        if Item.objects.filter(agent=instance).exclude(**fields).update(**fields, updated_at=timezone.now()):
+            _invalidate_on_commit('member')
@@ -1,3 +1,268 @@
-from django.test import TestCase
+import random
+from decimal import Decimal
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+from agent.models import Agent
+from main.geo import haversine, nearest, queryset_candidates
+from member.models import Member
+from . import feed
+from .models import Item
+from .search import search_items
 
-# Create your tests here.
+def create_sellers(spots, items_each):
+    """One agent per (lat, lon) spot, each selling items_each items"""
+    agents = []
+    for i, (lat, lon) in enumerate(spots):
+        seller = Member.objects.create(username=f'seller{i}', email=f'seller{i}@example.com', latitude=lat, longitude=lon)
+        agent = Agent.objects.create(user=seller, description='')
+        for j in range(items_each):
+            Item.objects.create(name=f'Oil {i}-{j}', description='', price=Decimal('10.00'), stock=1, category='waste_oil', agent=agent)
+        agents.append(agent)
+    return agents
+
+class NearestTests(TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        # Clustered around the viewer with a long tail; every seller's items tie on distance
+        spots = [(-6.2 + rng.uniform(-1, 1) ** 3 * 3, 106.8 + rng.uniform(-1, 1) ** 3 * 3) for _ in range(15)]
+        create_sellers(spots, 3)
+        self.member = Member.objects.create(username='buyer', email='buyer@example.com', latitude=-6.2, longitude=106.8)
+
+    def brute_force(self, radius=None):
+        ranked = sorted(
+            (haversine(self.member.latitude, self.member.longitude, item.seller_latitude, item.seller_longitude), item.id)
+            for item in Item.objects.all()
+        )
+        return [item_id for dist, item_id in ranked if radius is None or dist <= radius]
+
+    def test_keyset_pages_follow_haversine_order(self):
+        candidates = queryset_candidates(Item.objects.all(), 'seller_')
+        # Pages of 4 split the groups of 3 tied items across page boundaries
+        for radius in (None, 100):
+            seen, after = [], None
+            while True:
+                ranked = nearest(candidates, self.member.latitude, self.member.longitude, radius, 5, after)
+                seen += [item_id for _, item_id in ranked[:4]]
+                if len(ranked) <= 4:
+                    break
+                after = ranked[3]
+            expected = self.brute_force(radius)
+            self.assertEqual(seen, expected)
+            self.assertTrue(0 < len(expected))
+
+    def test_marketplace_cursor_walks_every_item_once(self):
+        client = APIClient()
+        client.force_authenticate(self.member)
+        seen, params = [], {'limit': 4}
+        while True:
+            body = client.get('/item/all/', params).json()
+            seen += [item['id'] for item in body['items']]
+            if body['next_cursor'] is None:
+                break
+            params['cursor'] = body['next_cursor']
+        self.assertEqual(seen, self.brute_force())
+
+class FeedInvalidationTests(TransactionTestCase):
+    # Invalidation waits for on_commit, which only fires outside TestCase's wrapping transaction
+    def setUp(self):
+        cache.clear()
+        feed._snapshots.clear()
+        self.agent, = create_sellers([(-6.2, 106.8)], 1)
+        self.item = Item.objects.get()
+
+    def test_saving_an_item_rebuilds_the_feed(self):
+        before = feed.get_feed_snapshot(False)
+        self.assertIs(feed.get_feed_snapshot(False), before)
+
+        self.item.price = Decimal('12.50')
+        self.item.save()
+        after = feed.get_feed_snapshot(False)
+        self.assertIsNot(after, before)
+        self.assertEqual(after.payloads[self.item.id]['price'], 12.5)
+
+    def test_moving_a_seller_rebuilds_the_feed(self):
+        before = feed.get_feed_snapshot(False)
+        agents_feed = feed.get_feed_snapshot(True)
+
+        seller = Member.objects.get(pk=self.agent.user_id)
+        seller.latitude = -7.25
+        seller.save()
+        after = feed.get_feed_snapshot(False)
+        self.assertIsNot(after, before)
+        self.assertEqual(after.lats.tolist(), [-7.25])
+        # Agents don't see agent items, so their feed is left alone
+        self.assertIs(feed.get_feed_snapshot(True), agents_feed)
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.agents = create_sellers([(-6.20, 106.80), (-6.30, 106.90), (-6.25, 106.85)], 0)
+        # Identical names score the same, so each score is shared by three sellers at different distances
+        for name in ('Used cooking oil', 'Used cooking oil jerry can', 'Oil drum'):
+            for agent in self.agents:
+                Item.objects.create(name=name, description='', price=Decimal('10.00'), stock=1, category='waste_oil', agent=agent)
+        self.member = Member.objects.create(username='buyer', email='buyer@example.com', latitude=-6.21, longitude=106.81)
+
+    def search(self, limit, **kwargs):
+        return search_items('oil', 'agent', limit, self.member.latitude, self.member.longitude, **kwargs)
+
+    def test_pages_match_ranking_every_match(self):
+        everything = self.search(100)
+        self.assertEqual(len(everything), 9)
+        ranks = [(-score, dist, item_id) for item_id, score, dist in everything]
+        self.assertEqual(ranks, sorted(ranks))
+        # Cutting through a group of ties still orders it by distance
+        for limit in range(1, 10):
+            self.assertEqual(self.search(limit), everything[:limit])
+        # Without a location the database breaks ties by id
+        unlocated = search_items('oil', 'agent', 100)
+        self.assertEqual([(-score, item_id) for item_id, score, _ in unlocated], sorted((-score, item_id) for item_id, score, _ in everything))
+        self.assertEqual(search_items('oil', 'agent', 4), unlocated[:4])
+
+    def test_unavailable_and_distant_items_are_skipped_before_the_page_is_cut(self):
+        everything = self.search(100)
+        available = {item_id for item_id, _, _ in everything[::2]}
+        self.assertEqual(self.search(3, available=available), [row for row in everything if row[0] in available][:3])
+
+        nearby = [row for row in everything if row[2] <= 5]
+        self.assertTrue(0 < len(nearby) < len(everything))
+        self.assertEqual(self.search(2, radius=5), nearby[:2])
+
+    def test_view_fills_the_page_from_the_snapshot(self):
+        client = APIClient()
+        client.force_authenticate(self.member)
+        response = client.get('/item/search/', {'q': 'oil', 'limit': 4})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()['items']], [row[0] for row in self.search(4)])
+
+class SellerSyncTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        feed._snapshots.clear()
+        self.seller = Member.objects.create(username='seller', email='seller@example.com', latitude=-6.2, longitude=106.8)
+        self.agent = Agent.objects.create(user=self.seller, description='')
+        self.member_item = Item.objects.create(name='Jerry can', description='', price=Decimal('5.00'), stock=1, category='waste_oil', member=self.seller)
+        self.agent_item = Item.objects.create(name='Oil', description='', price=Decimal('10.00'), stock=1, category='waste_oil', agent=self.agent)
+
+    def test_renaming_and_moving_a_seller_refreshes_their_items_and_feeds(self):
+        # Agents see member items and members see agent items
+        feed.get_feed_snapshot(True)
+        feed.get_feed_snapshot(False)
+
+        seller = Member.objects.get(pk=self.seller.pk)
+        seller.username = 'renamed'
+        seller.latitude, seller.longitude = -7.25, 112.75
+        seller.save()
+
+        for item in Item.objects.all():
+            self.assertEqual(
+                (item.seller_name, item.seller_latitude, item.seller_longitude, item.seller_geohash),
+                ('renamed', -7.25, 112.75, seller.geohash)
+            )
+        agents_feed, members_feed = feed.get_feed_snapshot(True), feed.get_feed_snapshot(False)
+        self.assertEqual(agents_feed.payloads[self.member_item.id]['member_name'], 'renamed')
+        self.assertEqual(members_feed.payloads[self.agent_item.id]['agent_name'], 'renamed')
+        self.assertEqual((agents_feed.lats.tolist(), members_feed.lons.tolist()), ([-7.25], [112.75]))
+
+    def test_saving_other_fields_leaves_items_alone(self):
+        before = Item.objects.get(pk=self.agent_item.pk).updated_at
+        seller = Member.objects.get(pk=self.seller.pk)
+        seller.points = 10
+        seller.save()
+        self.assertEqual(Item.objects.get(pk=self.agent_item.pk).updated_at, before)
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.agent, = create_sellers([(-6.2, 106.8)], 0)
+        self.client = APIClient()
+        self.client.force_authenticate(Member.objects.get(pk=self.agent.user_id))
+
+    def upload(self, name, content, **data):
+        return self.client.post('/item/import/', {'file': SimpleUploadedFile(name, content.encode()), **data}, format='multipart')
+
+    def test_csv_creates_valid_rows_and_reports_the_rest(self):
+        response = self.upload('items.csv', (
+            "product_title,price,quantity,waste_category,status\n"
+            "Used oil,10.50,4,waste_oil,available\n"
+            ",10,4,waste_oil,\n"
+            "Drum,abc,4,waste_oil,\n"
+            "Jerry can,-1,4,waste_oil,\n"
+            "Bottles,2,7,plastic,\n"
+            "Tin,2,1,metal,lost\n"
+        ))
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual((report['created'], report['error_count']), (2, 4))
+        # Rows are numbered as lines of the file, the header being line 1
+        self.assertEqual([error['row'] for error in report['errors']], [3, 4, 5, 7])
+        self.assertEqual(list(report['errors'][0]['errors']), ['product_title'])
+        self.assertEqual(list(report['errors'][1]['errors']), ['price'])
+        self.assertEqual(report['errors'][2]['errors'], {'price': ['Must not be negative.']})
+        self.assertEqual(list(report['errors'][3]['errors']), ['status'])
+
+        items = Item.objects.filter(id__in=report['item_ids']).order_by('id')
+        self.assertEqual([(item.name, item.stock, item.seller_type) for item in items], [('Used oil', 4, 'agent'), ('Bottles', 7, 'agent')])
+
+    def test_jsonl_reports_unparseable_lines(self):
+        response = self.upload('items.jsonl', (
+            '{"product_title": "Used oil", "quantity": 4, "waste_category": "waste_oil"}\n'
+            '{"product_title": "Drum"\n'
+            '\n'
+            '["not", "an", "object"]\n'
+            '{"product_title": "Bottles", "quantity": "x", "waste_category": "plastic"}\n'
+        ))
+        report = response.json()
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(report['errors'][:2], [
+            {'row': 2, 'errors': {'row': ['Invalid JSON']}},
+            {'row': 4, 'errors': {'row': ['Each line must be a JSON object']}},
+        ])
+        self.assertEqual((report['errors'][2]['row'], list(report['errors'][2]['errors'])), (5, ['quantity']))
+        # Price is optional, as in add_item
+        self.assertEqual(Item.objects.get(id__in=report['item_ids']).price, 0)
+
+class BulkUpdateTests(TestCase):
+    def setUp(self):
+        self.agent, = create_sellers([(-6.2, 106.8)], 3)
+        self.items = list(Item.objects.order_by('id'))
+        self.client = APIClient()
+        self.client.force_authenticate(Member.objects.get(pk=self.agent.user_id))
+
+    def test_body_must_be_an_object(self):
+        response = self.client.post('/item/bulk-update/', [{'item_id': self.items[0].id, 'stock': 3}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['status'], 'error')
+
+    def test_a_negative_stock_rolls_back_the_whole_batch(self):
+        response = self.client.post('/item/bulk-update/', {'items': [
+            {'item_id': self.items[0].id, 'stock': 9, 'price': '12.50'},
+            {'item_id': self.items[1].id, 'stock_delta': -2},
+            {'item_id': self.items[2].id, 'stock_delta': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            list(Item.objects.order_by('id').values_list('stock', 'price')),
+            [(item.stock, item.price) for item in self.items]
+        )
+
+        response = self.client.post('/item/bulk-update/', {'items': [
+            {'item_id': self.items[0].id, 'stock': 9},
+            {'item_id': self.items[1].id, 'stock_delta': -1},
+        ]}, format='json')
+        self.assertEqual(response.json(), {'status': 'success', 'updated': 2})
+        self.assertEqual(list(Item.objects.order_by('id').values_list('stock', flat=True)), [9, 0, 1])
+
+class CatalogFilterTests(TestCase):
+    def setUp(self):
+        create_sellers([(-6.2, 106.8)], 2)
+        Item.objects.filter(name__endswith='-1').update(price=Decimal('25.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(Member.objects.create(username='buyer', email='buyer@example.com', latitude=-6.21, longitude=106.81))
+
+    def test_price_bounds_must_be_finite_numbers(self):
+        for params in ({'min_price': 'nan'}, {'max_price': 'inf'}, {'min_price': '-Infinity'}, {'max_price': 'sNaN'}, {'min_price': 'cheap'}):
+            response = self.client.get('/item/all/', params)
+            self.assertEqual(response.status_code, 400, params)
+        response = self.client.get('/item/all/', {'min_price': '20', 'max_price': '30'})
+        self.assertEqual([item['price'] for item in response.json()['items']], [25.0])
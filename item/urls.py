@@ -7,6 +7,8 @@ urlpatterns = [
     
     # CRUD operations
     path('add/', views.add_item, name='add_item'),
+    path('import/', views.bulk_import_items, name='bulk_import_items'),
+    path('bulk-update/', views.bulk_update_items, name='bulk_update_items'),
     path('<int:item_id>/update/', views.update_item, name='update_item'),
     path('<int:item_id>/delete/', views.delete_item, name='delete_item'),
     
@@ -15,4 +17,7 @@ urlpatterns = [
     
     # Marketplace items (members see agent items, agents see member items)
     path('all/', views.get_all_items, name='marketplace_items'),
+    
+    # Full-text search over marketplace items
+    path('search/', views.search_marketplace_items, name='search_marketplace_items'),
 ]
\ No newline at end of file
@@ -1,28 +1,53 @@
 from django.http import JsonResponse
+from decimal import Decimal, InvalidOperation
+from django.db import transaction as db_transaction
+from django.db.models import Count, F, Max, Q
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from .models import Item
+from .feed import counterpart_seller_type, get_feed_snapshot, invalidate_feed, serialize_feed_item, viewer_role
+from .filters import facet_counts, near, parse_filters
+from .imports import import_items
+from .search import search_items
+from main.geo import nearest, queryset_candidates
+from main.conditional import conditional
+from main.pagination import encode_cursor, get_distance_cursor, get_page_size
 from agent.models import Agent
 from member.models import Member
 from django.views.decorators.csrf import csrf_exempt
-from storages.backends.s3boto3 import S3Boto3Storage
+from main.images import image_urls
+from main.uploads import enqueue_image, stage_image
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.decorators import parser_classes
-from math import radians, cos, sin, asin, sqrt
 
-def haversine(lat1, lon1, lat2, lon2):
-    """Calculate the great circle distance between two points on the earth (specified in decimal degrees)"""
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    r = 6371  # Radius of earth in kilometers
-    return c * r
+def own_items(user):
+    """Items sold by the user, as an agent if they are one and as a member otherwise"""
+    if hasattr(user, 'agent'):
+        return Item.objects.filter(agent=user.agent)
+    return Item.objects.filter(member=user)
+
+def item_version(request, item_id):
+    """ETag / Last-Modified of an item from one primary-key lookup"""
+    updated_at = Item.objects.filter(id=item_id).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return f"{item_id}-{updated_at.timestamp()}", updated_at
+
+def my_items_version(request):
+    """ETag / Last-Modified of the user's listing; the count catches deletions"""
+    if not isinstance(request.user, Member):
+        return None
+    version = own_items(request.user).aggregate(count=Count('id'), updated_at=Max('updated_at'))
+    updated_at = version['updated_at']
+    etag = f"{request.user.id}-{version['count']}-{updated_at.timestamp() if updated_at else 0}"
+    return etag, updated_at
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 @csrf_exempt
+@conditional(item_version)
 def item_detail(request, item_id):
     """Get detailed information about a specific item"""
     try:
@@ -38,15 +63,16 @@ def item_detail(request, item_id):
             "category": item.category,
             "unit": item.unit,
             "image_url": item.image.url if item.image else None,
+            "image_urls": image_urls(item),
+            "image_status": item.image_status,
         }
         
         # Add owner information
-        if item.agent:
-            response["agent_id"] = item.agent.id
-            response["owner_name"] = item.agent.user.username
-        elif item.member:
-            response["member_id"] = item.member.id
-            response["owner_name"] = item.member.username
+        if item.agent_id:
+            response["agent_id"] = item.agent_id
+        elif item.member_id:
+            response["member_id"] = item.member_id
+        response["owner_name"] = item.seller_name
         
         return JsonResponse(response)
     
@@ -84,12 +110,14 @@ def add_item(request):
             agent=user.agent if is_agent else None
         )
         if image:
-            storage = S3Boto3Storage()
-            key = f"photos/{image.name}"
-            saved_name = storage.save(key, image)
-            item.image.name = saved_name
+            # Processed and uploaded by the background workers; image_status stays pending until then
+            stage_image(item, image)
         item.save()
-        return JsonResponse({"status": "success", "message": "Item added successfully", "item_id": item.id})
+        if image:
+            enqueue_image(item)
+        return JsonResponse({"status": "success", "message": "Item added successfully", "item_id": item.id, "image_status": item.image_status})
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
 
@@ -122,17 +150,144 @@ def update_item(request, item_id):
             item.unit = request.data.get('unit')
         image = request.FILES.get('image')
         if image:
-            storage = S3Boto3Storage()
-            key = f"photos/{image.name}"
-            saved_name = storage.save(key, image)
-            item.image.name = saved_name
+            # Processed and uploaded by the background workers; image_status stays pending until then
+            stage_image(item, image)
         item.save()
-        return JsonResponse({"status": "success", "message": "Item updated successfully"})
+        if image:
+            enqueue_image(item)
+        return JsonResponse({"status": "success", "message": "Item updated successfully", "image_status": item.image_status})
     except Item.DoesNotExist:
         return JsonResponse({"status": "error", "message": "Item not found or you don't have permission to edit it"}, status=404)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+@parser_classes([MultiPartParser, FormParser])
+def bulk_import_items(request):
+    """Create many items from an uploaded CSV or JSON Lines file (agents only).
+
+    Each row uses the add_item field names (product_title, description, price, quantity,
+    waste_category, unit) plus optional status and location. Valid rows are created,
+    invalid ones are listed in the per-row error report.
+    """
+    user = request.user
+    if not hasattr(user, 'agent'):
+        return JsonResponse({"status": "error", "message": "Only agents can import items"}, status=403)
+    
+    upload = request.FILES.get('file')
+    if not upload:
+        return JsonResponse({"status": "error", "message": "file is required"}, status=400)
+    fmt = request.data.get('format') or ('jsonl' if upload.name.lower().endswith(('.jsonl', '.ndjson')) else 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        return JsonResponse({"status": "error", "message": "format must be csv or jsonl"}, status=400)
+    
+    try:
+        report = import_items(upload, fmt, user.agent)
+    except UnicodeDecodeError:
+        return JsonResponse({"status": "error", "message": "File must be UTF-8 encoded"}, status=400)
+    return JsonResponse({"status": "success", **report})
+
+BULK_UPDATE_FIELDS = ('stock', 'price', 'status')
+MAX_BULK_UPDATES = 1000
+
+def _as_int(entry, key):
+    try:
+        return int(entry[key])
+    except (TypeError, ValueError):
+        raise ValueError(f'{key} must be an integer')
+
+def parse_item_change(entry):
+    """Validate one {item_id, stock | stock_delta, price, status} entry; returns (item_id, {field: value})"""
+    if not isinstance(entry, dict):
+        raise ValueError('Each change must be an object')
+    try:
+        item_id = _as_int(entry, 'item_id')
+        changes = {}
+        if entry.get('stock') is not None:
+            changes['stock'] = _as_int(entry, 'stock')
+            if changes['stock'] < 0:
+                raise ValueError('stock must not be negative')
+        if entry.get('stock_delta') is not None:
+            if 'stock' in changes:
+                raise ValueError('Use stock or stock_delta, not both')
+            changes['stock'] = F('stock') + _as_int(entry, 'stock_delta')
+        if entry.get('price') is not None:
+            changes['price'] = Decimal(str(entry['price']))
+            if not changes['price'].is_finite() or changes['price'] < 0:
+                raise ValueError('price must be a non-negative number')
+            Item._meta.get_field('price').run_validators(changes['price'])
+        if entry.get('status') is not None:
+            if entry['status'] not in dict(Item.STATUS_CHOICES):
+                raise ValueError('Invalid status')
+            changes['status'] = entry['status']
+    except KeyError:
+        raise ValueError('item_id is required')
+    except (TypeError, InvalidOperation, ValidationError):
+        raise ValueError('Invalid price')
+    if not changes:
+        raise ValueError('Nothing to update')
+    return item_id, changes
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+def bulk_update_items(request):
+    """Update stock, price and/or status of many of the user's items at once.
+
+    Body: {"items": [{"item_id", "stock" or "stock_delta", "price", "status"}, ...]}.
+    All changes are applied in one transaction, or none when any entry is invalid.
+    """
+    user = request.user
+    if not isinstance(user, Member):
+        return JsonResponse({"status": "error", "message": "Authentication required"}, status=403)
+    
+    # The body may be any JSON value, e.g. a bare list
+    entries = request.data.get('items') if isinstance(request.data, dict) else None
+    if not isinstance(entries, list) or not entries or len(entries) > MAX_BULK_UPDATES:
+        return JsonResponse({"status": "error", "message": f"items must be a list of 1 to {MAX_BULK_UPDATES} changes"}, status=400)
+    
+    changes, errors = {}, []
+    for index, entry in enumerate(entries):
+        try:
+            item_id, fields = parse_item_change(entry)
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+            continue
+        if item_id in changes:
+            errors.append({"index": index, "error": "Duplicate item_id"})
+            continue
+        changes[item_id] = fields
+    if errors:
+        return JsonResponse({"status": "error", "message": "Invalid changes", "errors": errors}, status=400)
+    
+    with db_transaction.atomic():
+        # One query checks ownership of every id and locks the rows
+        items = own_items(user).select_for_update().only('id', *BULK_UPDATE_FIELDS).in_bulk(list(changes))
+        missing = [item_id for item_id in changes if item_id not in items]
+        if missing:
+            return JsonResponse({"status": "error", "message": "Items not found or you don't have permission to edit them", "item_ids": missing}, status=404)
+        
+        fields = sorted({field for fields in changes.values() for field in fields})
+        now = timezone.now()
+        for item_id, item in items.items():
+            for field in fields:
+                # Fields an entry leaves alone keep their current value, even if a checkout changed it meanwhile
+                setattr(item, field, changes[item_id].get(field, F(field)))
+            item.updated_at = now
+        Item.objects.bulk_update(items.values(), [*fields, 'updated_at'])
+        
+        if 'stock' in fields and Item.objects.filter(id__in=list(changes), stock__lt=0).exists():
+            db_transaction.set_rollback(True)
+            return JsonResponse({"status": "error", "message": "stock_delta would make stock negative"}, status=400)
+    
+    # bulk_update sends no post_save
+    invalidate_feed(viewer_role(not hasattr(user, 'agent')))
+    return JsonResponse({"status": "success", "updated": len(items)})
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 @csrf_exempt
@@ -171,6 +326,7 @@ def delete_item(request, item_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 @csrf_exempt
+@conditional(my_items_version, private=True)
 def my_items(request):
     """Get all items for the logged-in user (member or agent)"""
     user = request.user
@@ -184,10 +340,7 @@ def my_items(request):
         return JsonResponse({"status": "error", "message": "Authentication required"}, status=403)
     
     # Query items based on user type
-    if is_agent:
-        items = Item.objects.filter(agent=user.agent)
-    else:  # is_member
-        items = Item.objects.filter(member=user)
+    items = own_items(user)
     
     items_list = []
     for item in items:
@@ -201,13 +354,15 @@ def my_items(request):
             "unit": item.unit,
             "created_at": item.created_at.strftime("%Y-%m-%d %H:%M:%S") if hasattr(item, 'created_at') else None,
             "image_url": item.image.url if item.image else None,
+            "image_urls": image_urls(item),
+            "image_status": item.image_status,
         }
         
         # Add owner information
-        if item.agent:
-            item_data["agent_id"] = item.agent.id
-        elif item.member:
-            item_data["member_id"] = item.member.id
+        if item.agent_id:
+            item_data["agent_id"] = item.agent_id
+        elif item.member_id:
+            item_data["member_id"] = item.member_id
             
         items_list.append(item_data)
     
@@ -221,7 +376,16 @@ def my_items(request):
 @permission_classes([IsAuthenticated])
 @csrf_exempt
 def get_all_items(request):
-    """Get marketplace items - members see agent products, agents see member products, sorted by distance"""
+    """Get marketplace items - members see agent products, agents see member products, sorted by distance.
+
+    Results are paginated by (distance, id): limit sets the page size (default PAGE_SIZE)
+    and the next page is requested with the next_cursor of the previous response.
+    radius (km) optionally keeps only items within that distance.
+
+    Filters: category, unit, status (default available) and seller_type (default the
+    counterpart role) may be repeated; min_price/max_price bound the price.
+    facets=1 adds per-value counts of every facet to the response.
+    """
     user = request.user
     
     # Check if user has location set
@@ -236,74 +400,96 @@ def get_all_items(request):
     if not isinstance(user, Member):
         return JsonResponse({"status": "error", "message": "Authentication required"}, status=403)
     
-    items_list = []
+    try:
+        radius = float(request.GET['radius']) if request.GET.get('radius') else None
+        limit = get_page_size(request)
+        after = get_distance_cursor(request)
+        filters = parse_filters(request.GET)
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "Invalid radius, limit, cursor or filter"}, status=400)
+    if radius is not None and radius <= 0:
+        return JsonResponse({"status": "error", "message": "radius must be positive"}, status=400)
     
-    # Query items based on user type
-    if is_agent:
-        # Agents see member items (only those with valid location)
-        items = Item.objects.filter(
-            member__isnull=False,
-            member__latitude__isnull=False,
-            member__longitude__isnull=False
-        ).select_related('member')
-        
-        for item in items:
-            # Calculate distance between user and item owner
-            dist = haversine(
-                user.latitude, user.longitude, 
-                item.member.latitude, item.member.longitude
-            )
-            
-            items_list.append({
-                "id": item.id,
-                "name": item.name,
-                "description": item.description,
-                "price": float(item.price),
-                "stock": item.stock,
-                "member_id": item.member.id,
-                "member_name": item.member.username,
-                "category": item.category,
-                "unit": item.unit if hasattr(item, 'unit') else None,
-                "created_at": item.created_at.strftime("%Y-%m-%d %H:%M:%S") if hasattr(item, 'created_at') else None,
-                "image_url": item.image.url if item.image else None,
-                "distance_km": round(dist, 2),
-            })
-    else:  # is_member
-        # Members see agent items (only those with valid location)
-        items = Item.objects.filter(
-            agent__isnull=False,
-            agent__user__latitude__isnull=False,
-            agent__user__longitude__isnull=False
-        ).select_related('agent')
-        
-        for item in items:
-            # Calculate distance between user and item owner (agent)
-            dist = haversine(
-                user.latitude, user.longitude, 
-                item.agent.user.latitude, item.agent.user.longitude
-            )
-            
-            items_list.append({
-                "id": item.id,
-                "name": item.name,
-                "description": item.description,
-                "price": float(item.price),
-                "stock": item.stock,
-                "agent_id": item.agent.id,
-                "agent_name": item.agent.user.username,
-                "category": item.category,
-                "unit": item.unit if hasattr(item, 'unit') else None,
-                "created_at": item.created_at.strftime("%Y-%m-%d %H:%M:%S") if hasattr(item, 'created_at') else None,
-                "image_url": item.image.url if item.image else None,
-                "distance_km": round(dist, 2),
+    filtered = bool(filters)
+    filters.setdefault('seller_type', Q(seller_type=counterpart_seller_type(is_agent)))
+    filters.setdefault('status', Q(status='available'))
+    located = Item.objects.filter(seller_latitude__isnull=False, seller_longitude__isnull=False)
+    
+    if filtered:
+        # Filter in the database, then rank the matching rows around the user
+        items = located.filter(*filters.values())
+        ranked = nearest(queryset_candidates(items, 'seller_'), user.latitude, user.longitude, radius, limit + 1, after)
+        page = ranked[:limit]
+        items_by_id = items.in_bulk([item_id for _, item_id in page])
+        items_list = [
+            {**serialize_feed_item(items_by_id[item_id]), "distance_km": round(dist, 2)}
+            for dist, item_id in page
+        ]
+    else:
+        # Cached candidate set of the user's role (agents see member items, members see agent items)
+        snapshot = get_feed_snapshot(is_agent)
+        # Rank by distance using only the geohash cells around the user; one extra row tells us if there is a next page
+        ranked = nearest(snapshot.candidates, user.latitude, user.longitude, radius, limit + 1, after)
+        page = ranked[:limit]
+        items_list = [snapshot.payload(item_id, dist) for dist, item_id in page]
+    
+    response = {
+        "status": "success",
+        "items": items_list,
+        "count": len(items_list),
+        "next_cursor": encode_cursor(*page[-1]) if len(ranked) > limit else None
+    }
+    if request.GET.get('facets') in ('1', 'true'):
+        # Facets count the radius as its bounding box so they stay plain GROUP BY queries
+        nearby = located.filter(near(user.latitude, user.longitude, radius)) if radius is not None else located
+        response["facets"] = facet_counts(nearby, filters)
+    
+    return JsonResponse(response)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+def search_marketplace_items(request):
+    """Full-text search over the marketplace items the user can see, ranked by relevance then distance.
 
-            })
+    Query parameters: q (search text), radius (km, optional) and limit (page size).
+    """
+    user = request.user
+    
+    if not isinstance(user, Member):
+        return JsonResponse({"status": "error", "message": "Authentication required"}, status=403)
+    
+    is_agent = hasattr(user, 'agent')
+    
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({"status": "error", "message": "q is required"}, status=400)
+    
+    try:
+        radius = float(request.GET['radius']) if request.GET.get('radius') else None
+        limit = get_page_size(request)
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "Invalid radius or limit"}, status=400)
+    if radius is not None and (radius <= 0 or not user.latitude or not user.longitude):
+        return JsonResponse({"status": "error", "message": "radius must be positive and your location must be set"}, status=400)
     
-    # Sort by distance (nearest first)
-    items_list.sort(key=lambda x: x['distance_km'])
+    # Agents search member items, members search agent items. Items written after the
+    # snapshot was built can't be rendered yet, so they are skipped before the page is cut
+    snapshot = get_feed_snapshot(is_agent)
+    results = search_items(
+        query, counterpart_seller_type(is_agent), limit,
+        user.latitude, user.longitude, radius, available=snapshot.payloads
+    )
+
+    items_list = []
+    for item_id, score, dist in results:
+        item_data = snapshot.payload(item_id, dist)
+        item_data["score"] = round(score, 4)
+        items_list.append(item_data)
     
     return JsonResponse({
         "status": "success",
         "items": items_list,
         "count": len(items_list)
-    })
\ No newline at end of file
+    })
@@ -0,0 +1,38 @@
+from calendar import timegm
+from functools import wraps
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+def conditional(version_func, private=False):
+    """
+    Answer GETs with 304 Not Modified when the client's ETag / Last-Modified still match.
+
+    version_func(request, *args, **kwargs) returns (etag, last_modified) for the
+    resource, cheaply and without serializing it, or None to always run the view
+    (e.g. when the resource does not exist). last_modified may be None.
+    Like django.views.decorators.http.condition, but with one lookup for both validators.
+    """
+    def decorator(view):
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            version = version_func(request, *args, **kwargs) if request.method in ('GET', 'HEAD') else None
+            if version is None:
+                return view(request, *args, **kwargs)
+
+            etag, last_modified = version
+            etag = quote_etag(str(etag))
+            timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+
+            response.headers['ETag'] = etag
+            if timestamp is not None:
+                response.headers['Last-Modified'] = http_date(timestamp)
+            # Clients must revalidate, which is what makes polling cheap
+            patch_cache_control(response, no_cache=True, **({'private': True} if private else {}))
+            return response
+        return inner
+    return decorator
@@ -0,0 +1,82 @@
+import os
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import FileSystemStorage
+from django.urls import reverse
+from storages.backends.s3boto3 import S3Boto3Storage
+
+# Clients upload photos straight to storage with a presigned request, then confirm the upload:
+#   1. POST /api/uploads/ returns {upload_id, method, url, fields, headers, expires_in}
+#   2. the client sends the file to url: a multipart POST with fields + "file" when method is POST,
+#      or the raw bytes with headers when method is PUT
+#   3. POST /api/uploads/<upload_id>/confirm/ attaches it to an item or blog and queues its processing
+# Unconfirmed uploads are never served; on S3 a lifecycle rule on DIRECT_UPLOAD_PREFIX expires them.
+
+DIRECT_UPLOAD_PREFIX = 'uploads'
+LOCAL_UPLOAD_SALT = 'main.direct_uploads'
+
+def upload_key(user_id, upload_id):
+    """Raw uploads are namespaced by user, so a user can only confirm their own"""
+    return f"{DIRECT_UPLOAD_PREFIX}/{user_id}/{upload_id}"
+
+class S3DirectUploads:
+    """Presigned S3 POST, whose policy enforces the content type and the size limit"""
+
+    def __init__(self):
+        self.storage = S3Boto3Storage()
+
+    def presign(self, key, content_type, request):
+        post = self.storage.connection.meta.client.generate_presigned_post(
+            Bucket=self.storage.bucket_name,
+            Key=key,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, settings.DIRECT_UPLOAD_MAX_SIZE],
+            ],
+            ExpiresIn=settings.DIRECT_UPLOAD_EXPIRY,
+        )
+        return {'method': 'POST', 'url': post['url'], 'fields': post['fields'], 'headers': {}}
+
+class LocalDirectUploads:
+    """
+    Filesystem stand-in for offline development and tests: a signed, expiring PUT URL
+    served by main.views.local_upload, with the same limits S3 enforces.
+    """
+
+    def __init__(self):
+        self.storage = FileSystemStorage(location=settings.DIRECT_UPLOAD_ROOT)
+
+    def presign(self, key, content_type, request):
+        token = signing.dumps({'key': key, 'content_type': content_type}, salt=LOCAL_UPLOAD_SALT)
+        url = request.build_absolute_uri(reverse('local_upload', args=[token]))
+        return {'method': 'PUT', 'url': url, 'fields': {}, 'headers': {'Content-Type': content_type}}
+
+    def receive(self, token, content_type, body, length):
+        """
+        Store the body of a PUT to a presigned URL.
+        Returns an error status (403 bad or expired URL, 413 too large) or None on success.
+        """
+        try:
+            grant = signing.loads(token, salt=LOCAL_UPLOAD_SALT, max_age=settings.DIRECT_UPLOAD_EXPIRY)
+        except signing.BadSignature:
+            return 403
+        if content_type != grant['content_type']:
+            return 403
+        if not 0 < length <= settings.DIRECT_UPLOAD_MAX_SIZE:
+            return 413
+        path = self.storage.path(grant['key'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as upload:
+            remaining = length
+            while remaining:
+                chunk = body.read(min(remaining, 64 * 1024))
+                if not chunk:
+                    break
+                upload.write(chunk)
+                remaining -= len(chunk)
+        return None
+
+def direct_uploads():
+    """The presigned upload backend: S3 when a bucket is configured, the local stand-in otherwise"""
+    return S3DirectUploads() if settings.DIRECT_UPLOAD_BACKEND == 's3' else LocalDirectUploads()
@@ -0,0 +1,135 @@
+import json
+import queue
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+# Live updates are pushed to clients as Server-Sent Events. Publishers hand events
+# to a broker under a channel name (e.g. "offer:42"); every open stream subscribed
+# to that channel receives them. Nothing is polled: an idle stream is a thread
+# blocked on an empty queue, waking only for events and heartbeats.
+
+class LocalBroker:
+    """
+    In-process stand-in for a message broker. Events only reach streams served by the
+    same process; a deployment running several processes needs a shared broker
+    (e.g. Redis pub/sub) behind the same publish / subscribe interface.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscriber in subscribers:
+            subscriber.put(event)
+
+    def subscribe(self, channel):
+        """A Subscription receiving the channel's events from now on; close it when done"""
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscribers[channel].add(subscription._queue)
+        return subscription
+
+    def _unsubscribe(self, channel, events):
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(events)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+class Subscription:
+    def __init__(self, broker, channel):
+        self._broker = broker
+        self._channel = channel
+        self._queue = queue.SimpleQueue()
+
+    def get(self, timeout):
+        """The next event, or None when none arrived within timeout seconds"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._broker._unsubscribe(self._channel, self._queue)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+_broker = LocalBroker()
+
+def broker():
+    return _broker
+
+class StreamSlots:
+    """
+    Counts the event streams open in this process. Each one holds a worker thread until
+    it ends, so past SSE_MAX_STREAMS new streams are turned away instead of starving
+    ordinary requests of threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+
+    def claim(self, events):
+        """events wrapped to give the slot back when the response is closed, or None when all slots are taken"""
+        with self._lock:
+            if self.open >= settings.SSE_MAX_STREAMS:
+                return None
+            self.open += 1
+        return _SlottedStream(self, events)
+
+    def _release(self):
+        with self._lock:
+            self.open -= 1
+
+class _SlottedStream:
+    def __init__(self, slots, events):
+        self._slots = slots
+        self._events = events
+        self._closed = False
+
+    def __iter__(self):
+        return iter(self._events)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._events.close()
+            self._slots._release()
+
+_stream_slots = StreamSlots()
+
+def stream_slots():
+    return _stream_slots
+
+def sse_event(data, event=None, event_id=None):
+    """One Server-Sent Event carrying data as JSON"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, cls=DjangoJSONEncoder)}")
+    return '\n'.join(lines) + '\n\n'
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets DRF views accept `Accept: text/event-stream`. The stream itself is a
+    StreamingHttpResponse; this only renders DRF's own errors (e.g. 401) as an event.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return sse_event(data, event='error').encode()
@@ -0,0 +1,173 @@
+from math import radians, cos, sin, asin, sqrt, pi
+import numpy as np
+from django.db.models import Q
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 7  # ~150m x 150m cells at the equator
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE = 2 * pi * EARTH_RADIUS_KM / 360
+
+def encode_geohash(lat, lon, precision=GEOHASH_PRECISION):
+    """Encode a point (in decimal degrees) as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        # Even bits split longitude, odd bits split latitude
+        value_range, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            value_range[0] = mid
+        else:
+            value_range[1] = mid
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+def cell_size(precision):
+    """Return the (height, width) of a geohash cell in degrees"""
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+def neighbor_cells(lat, lon, precision):
+    """Return the geohash cell containing the point plus its eight neighbours"""
+    height, width = cell_size(precision)
+    cells = set()
+    for dlat in (-height, 0, height):
+        for dlon in (-width, 0, width):
+            cell_lat = min(max(lat + dlat, -90.0), 90.0)
+            cell_lon = (lon + dlon + 180.0) % 360.0 - 180.0
+            cells.add(encode_geohash(cell_lat, cell_lon, precision))
+    return cells
+
+def covered_radius_km(lat, precision):
+    """Radius around the point that is guaranteed to lie inside its 3x3 block of cells"""
+    height, width = cell_size(precision)
+    # Cells get narrower away from the equator, so measure at the block's outer edge
+    edge_lat = min(abs(lat) + 2 * height, 90.0)
+    return min(height, width * cos(radians(edge_lat))) * KM_PER_DEGREE
+
+def precision_for_radius(lat, radius_km):
+    """Finest geohash precision whose 3x3 block covers radius_km, or 0 when no block is large enough"""
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        if covered_radius_km(lat, precision) >= radius_km:
+            return precision
+    return 0
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Calculate the great circle distance between two points on the earth (specified in decimal degrees)"""
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(sqrt(a))
+    return c * EARTH_RADIUS_KM
+
+def haversine_many(lat, lon, lats, lons):
+    """Distances in km from one origin to arrays of points, computed in a single vectorized pass"""
+    lat, lon = radians(lat), radians(lon)
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    a = np.sin((lats - lat) / 2) ** 2 + cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def nearest_indices(distances, k=None, ids=None):
+    """
+    Return the indices of the k smallest distances, nearest first.
+
+    Ties are broken by ids (or position) so the order is stable across calls.
+    Only the k selected entries are sorted; the rest are split off with argpartition.
+    """
+    distances = np.asarray(distances)
+    ids = np.arange(len(distances)) if ids is None else np.asarray(ids)
+    if k is None or k >= len(distances):
+        return np.lexsort((ids, distances))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    kth = distances[np.argpartition(distances, k - 1)[k - 1]]
+    # Keep every entry tied with the k-th one so ids decide who makes the cut
+    candidates = np.flatnonzero(distances <= kth)
+    order = np.lexsort((ids[candidates], distances[candidates]))
+    return candidates[order[:k]]
+
+def queryset_candidates(queryset, location=''):
+    """
+    Adapt a queryset for nearest(): the geohash cells are filtered in the database.
+    location is the lookup prefix of the rows' latitude/longitude/geohash fields (e.g. 'member__').
+    """
+    fields = ('id', f'{location}latitude', f'{location}longitude')
+
+    def candidates(cells):
+        rows = queryset
+        if cells is not None:
+            in_cells = Q()
+            for cell in cells:
+                in_cells |= Q(**{f'{location}geohash__startswith': cell})
+            rows = queryset.filter(in_cells)
+        rows = np.array(list(rows.values_list(*fields)), dtype=np.float64).reshape(-1, 3)
+        return rows[:, 0].astype(np.int64), rows[:, 1], rows[:, 2]
+
+    return candidates
+
+def nearest(candidates, lat, lon, radius=None, limit=None, after=None):
+    """
+    Return (distance_km, id) pairs sorted nearest first.
+
+    candidates(cells) returns (ids, latitudes, longitudes) arrays of the rows
+    whose geohash starts with one of cells (every row when cells is None).
+    Only the cells around (lat, lon) are scanned: with a radius the block is
+    sized to cover it, and for the k nearest the block starts small and widens
+    until the k-th candidate is closer than the distance the block is
+    guaranteed to cover. after is a (distance_km, id) keyset position; only
+    rows ordered after it are returned.
+    """
+    if radius is not None:
+        precision = precision_for_radius(lat, radius)
+    elif limit is not None:
+        precision = GEOHASH_PRECISION
+    else:
+        precision = 0
+
+    while True:
+        ids, lats, lons = candidates(neighbor_cells(lat, lon, precision) if precision else None)
+        distances = haversine_many(lat, lon, lats, lons)
+        keep = np.ones(len(ids), dtype=bool)
+        if radius is not None:
+            keep &= distances <= radius
+        if after is not None:
+            keep &= (distances > after[0]) | ((distances == after[0]) & (ids > after[1]))
+        ids, distances = ids[keep], distances[keep]
+        order = nearest_indices(distances, limit, ids)
+
+        # A radius-sized block (or a full scan) already holds every match
+        complete = radius is not None or precision == 0
+        if not complete and len(order) >= limit:
+            complete = distances[order[limit - 1]] <= covered_radius_km(lat, precision)
+        if complete:
+            return [(float(distances[i]), int(ids[i])) for i in order]
+        precision -= 1
+
+def bounding_box(lat, lon, radius_km):
+    """Return (min_lat, max_lat, min_lon, max_lon) around a point, or None for longitude when the box wraps around"""
+    dlat = radius_km / KM_PER_DEGREE
+    edge_lat = min(abs(lat) + dlat, 90.0)
+    if edge_lat >= 90.0:
+        return max(lat - dlat, -90.0), min(lat + dlat, 90.0), None, None
+    dlon = radius_km / (KM_PER_DEGREE * cos(radians(edge_lat)))
+    if lon - dlon < -180.0 or lon + dlon > 180.0:
+        return lat - dlat, lat + dlat, None, None
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
@@ -0,0 +1,91 @@
+import hashlib
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from .models import IdempotencyKey
+
+MAX_KEY_LENGTH = 255
+PRUNE_BATCH_SIZE = 1000
+# Responses telling the client to try again (conflict, rate limited) aren't stored either
+RETRYABLE_STATUSES = {409, 429}
+
+def request_fingerprint(request):
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+def replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return JsonResponse(
+            {"status": "error", "message": "This Idempotency-Key was already used for a different request."},
+            status=422
+        )
+    response = HttpResponse(bytes(record.content), status=record.status_code, content_type=record.content_type)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def idempotent(view):
+    """
+    Make a POST safe to retry: the first response to a request carrying an Idempotency-Key
+    header is stored for IDEMPOTENCY_KEY_TTL seconds and replayed for every retry with
+    the same key, so the view's side effects happen once. Requests without the header
+    run as usual. Server errors (5xx) and RETRYABLE_STATUSES aren't stored, so the
+    retry runs the view again.
+
+    The key is claimed in the same transaction that runs the view, so a concurrent
+    duplicate waits on the key's unique index and then replays the committed response.
+    """
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return JsonResponse(
+                {"status": "error", "message": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters."},
+                status=400
+            )
+
+        fingerprint = request_fingerprint(request)
+        now = timezone.now()
+        # A retry costs this one indexed lookup
+        record = IdempotencyKey.objects.filter(user=request.user, key=key, expires_at__gt=now).first()
+        if record is not None:
+            return replay(record, fingerprint)
+
+        with transaction.atomic():
+            IdempotencyKey.objects.filter(user=request.user, key=key, expires_at__lte=now).delete()
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(
+                        user=request.user, key=key, fingerprint=fingerprint,
+                        expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                    )
+            except IntegrityError:
+                # A concurrent request with the same key claimed it and has committed
+                return replay(IdempotencyKey.objects.get(user=request.user, key=key), fingerprint)
+
+            response = view(request, *args, **kwargs)
+            if response.status_code >= 500 or response.status_code in RETRYABLE_STATUSES:
+                # Release the key along with whatever the view did
+                transaction.set_rollback(True)
+                return response
+            record.status_code = response.status_code
+            record.content = response.content
+            record.content_type = response.get('Content-Type', '')
+            record.save(update_fields=['status_code', 'content', 'content_type'])
+            return response
+    return inner
+
+def prune_expired_keys():
+    """Delete expired keys in short batches along the expires_at index; returns how many"""
+    total = 0
+    while True:
+        expired = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list('pk', flat=True)
+        batch = list(expired[:PRUNE_BATCH_SIZE])
+        if not batch:
+            return total
+        total += IdempotencyKey.objects.filter(pk__in=batch).delete()[0]
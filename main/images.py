@@ -0,0 +1,97 @@
+import io
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+from storages.backends.s3boto3 import S3Boto3Storage
+
+# Fixed widths every uploaded photo is resized to (never upscaled); the largest doubles as the main image
+IMAGE_WIDTHS = {
+    'thumb': 320,
+    'medium': 800,
+    'large': 1600,
+}
+MAIN_SIZE = 'large'
+IMAGE_STATUS_CHOICES = [
+    ('ready', 'Ready'),
+    ('pending', 'Pending'),
+    ('failed', 'Failed'),
+]
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+def image_storage():
+    """Storage the processed photos are written to; names are content hashes, so rewriting one is harmless"""
+    return S3Boto3Storage(file_overwrite=True)
+
+def image_format():
+    """(Pillow format, extension) used for every variant; JPEG when Pillow was built without WebP"""
+    return ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+
+def check_image(upload):
+    """Cheap header check, so a file that is not an image is rejected before it is queued"""
+    try:
+        Image.open(upload).verify()
+    except (OSError, SyntaxError, Image.DecompressionBombError):
+        raise ValueError('Invalid image')
+    finally:
+        upload.seek(0)
+
+def decode_image(upload):
+    """
+    Decode an uploaded photo once, upright and without its EXIF/metadata.
+    Raises ValueError when the file is not an image Pillow can read.
+    """
+    try:
+        image = Image.open(upload)
+        # JPEGs can be decoded at a reduced scale straight away when they are much larger than needed
+        image.draft('RGB', (max(IMAGE_WIDTHS.values()),) * 2)
+        image = ImageOps.exif_transpose(image)
+        # Re-encoding from pixel data alone drops EXIF (GPS position, camera) and other metadata.
+        # convert() is what reads the pixels, so a truncated or corrupt file fails here
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        fmt, _ = image_format()
+        return image.convert('RGBA' if has_alpha and fmt == 'WEBP' else 'RGB')
+    except (OSError, SyntaxError, Image.DecompressionBombError):
+        raise ValueError('Invalid image')
+
+def render_variants(image):
+    """Encode the decoded image at every fixed width, largest first: {size: bytes}"""
+    fmt, _ = image_format()
+    options = {'quality': WEBP_QUALITY, 'method': 4} if fmt == 'WEBP' else {'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True}
+    variants = {}
+    for size, width in sorted(IMAGE_WIDTHS.items(), key=lambda entry: -entry[1]):
+        if image.width > width:
+            # Each variant is resized from the previous (larger) one rather than from the full image
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, fmt, **options)
+        variants[size] = buffer.getvalue()
+    return variants
+
+def image_names(digest, prefix='photos'):
+    """Content-addressed storage name of every size of the photo whose upload hashed to digest"""
+    _, extension = image_format()
+    return {size: f"{prefix}/{digest}/{size}.{extension}" for size in IMAGE_WIDTHS}
+
+def store_image(upload, digest):
+    """
+    Process an uploaded photo and save its variants under its content hash. Every size is
+    written, even when storage still has it: objects left by an earlier upload of the same
+    bytes may be about to be deleted. Returns {size: name}.
+    """
+    storage = image_storage()
+    names = image_names(digest)
+    variants = render_variants(decode_image(upload))
+    for size, name in names.items():
+        storage.save(name, ContentFile(variants[size]))
+    return names
+
+def image_urls(instance):
+    """
+    URL of every size of instance.image, or None without an image.
+    Images uploaded before processing existed have no variants and serve the original at every size.
+    """
+    if not instance.image:
+        return None
+    variants = instance.image_variants or {}
+    storage = instance.image.storage
+    return {size: storage.url(variants[size]) if size in variants else instance.image.url for size in IMAGE_WIDTHS}
@@ -0,0 +1,48 @@
+from time import perf_counter
+import numpy as np
+from django.core.management.base import BaseCommand
+from main.geo import haversine, haversine_many, nearest_indices
+
+class Command(BaseCommand):
+    help = "Benchmark the vectorized distance engine against the per-row haversine loop"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--limit', type=int, default=20, help="k for the top-k selection")
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        origin = (-6.2, 106.8)  # Jakarta
+        limit = options['limit']
+
+        self.stdout.write(f"{'points':>10} {'loop + sort':>14} {'numpy + sort':>14} {'numpy top-k':>14} {'speedup':>9}")
+        for size in options['sizes']:
+            lats = origin[0] + rng.uniform(-5, 5, size)
+            lons = origin[1] + rng.uniform(-5, 5, size)
+            ids = np.arange(size)
+            rows = list(zip(ids.tolist(), lats.tolist(), lons.tolist()))
+
+            def per_row_loop():
+                results = [(haversine(origin[0], origin[1], lat, lon), row_id) for row_id, lat, lon in rows]
+                results.sort()
+                return results
+
+            def vectorized_sort():
+                return nearest_indices(haversine_many(origin[0], origin[1], lats, lons), None, ids)
+
+            def vectorized_top_k():
+                return nearest_indices(haversine_many(origin[0], origin[1], lats, lons), limit, ids)
+
+            loop, full, top_k = (self.best_of(fn, options['repeat']) for fn in (per_row_loop, vectorized_sort, vectorized_top_k))
+            self.stdout.write(
+                f"{size:>10} {loop * 1000:>11.1f} ms {full * 1000:>11.1f} ms {top_k * 1000:>11.1f} ms {loop / top_k:>8.0f}x"
+            )
+
+    def best_of(self, fn, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = perf_counter()
+            fn()
+            timings.append(perf_counter() - start)
+        return min(timings)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from main.uploads import finalize_image, pending_images, run_job
+
+class Command(BaseCommand):
+    help = "Store the staged photos whose background upload was interrupted, e.g. by a restart"
+
+    def handle(self, *args, **options):
+        count = 0
+        for label, pk, token in pending_images():
+            run_job(finalize_image, label, pk, token)
+            count += 1
+        self.stdout.write(f"Processed {count} pending image(s)")
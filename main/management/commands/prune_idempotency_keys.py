@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from main.idempotency import prune_expired_keys
+
+class Command(BaseCommand):
+    help = "Delete expired Idempotency-Key records (run periodically, e.g. from cron)"
+
+    def handle(self, *args, **options):
+        count = prune_expired_keys()
+        self.stdout.write(f"Pruned {count} expired idempotency key(s)")
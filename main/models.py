@@ -1,3 +1,34 @@
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+class StoredImage(models.Model):
+    """A processed photo in storage, shared by every Item and Blog that uploaded the same bytes"""
+    digest = models.CharField(max_length=64, unique=True)  # SHA-256 of the uploaded file
+    name = models.CharField(max_length=255, unique=True)  # Main image name, as stored in Item.image / Blog.image
+    variants = models.JSONField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} references)"
+
+class IdempotencyKey(models.Model):
+    """The response to the first request a user sent with an Idempotency-Key; see main.idempotency"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # SHA-256 of the method, path and body
+    status_code = models.PositiveSmallIntegerField(null=True)  # None until the response is stored
+    content = models.BinaryField(default=b'')
+    content_type = models.CharField(max_length=100, blank=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_user_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code})"
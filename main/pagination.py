@@ -0,0 +1,58 @@
+import base64
+import binascii
+import json
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+MAX_PAGE_SIZE = 100
+
+def encode_cursor(*position):
+    """Encode a keyset position (e.g. the (distance, id) of the last row on a page) as an opaque cursor"""
+    raw = json.dumps(position, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor made by encode_cursor, raising ValueError if it was tampered with"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        position = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(position, list):
+        raise ValueError('Invalid cursor')
+    return position
+
+def get_page_size(request):
+    """Page size from the `limit` query parameter, defaulting to REST_FRAMEWORK['PAGE_SIZE']"""
+    limit = request.GET.get('limit')
+    if not limit:
+        return settings.REST_FRAMEWORK['PAGE_SIZE']
+    limit = int(limit)
+    if limit <= 0:
+        raise ValueError('limit must be positive')
+    return min(limit, MAX_PAGE_SIZE)
+
+def get_distance_cursor(request):
+    """The (distance_km, id) position from the `cursor` query parameter, or None on the first page"""
+    cursor = request.GET.get('cursor')
+    if not cursor:
+        return None
+    try:
+        distance, row_id = decode_cursor(cursor)
+        return float(distance), int(row_id)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+def get_time_cursor(request):
+    """The (timestamp, id) position from the `cursor` query parameter, or None on the first page"""
+    cursor = request.GET.get('cursor')
+    if not cursor:
+        return None
+    try:
+        timestamp, row_id = decode_cursor(cursor)
+        timestamp, row_id = parse_datetime(timestamp), int(row_id)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if timestamp is None:
+        raise ValueError('Invalid cursor')
+    return timestamp, row_id
@@ -0,0 +1,11 @@
+from rest_framework import serializers
+
+class ConfirmUploadSerializer(serializers.Serializer):
+    """Body of confirm_upload: the item or blog the upload becomes the photo of"""
+    item_id = serializers.IntegerField(required=False, min_value=1)
+    blog_id = serializers.IntegerField(required=False, min_value=1)
+
+    def validate(self, attrs):
+        if 'item_id' not in attrs and 'blog_id' not in attrs:
+            raise serializers.ValidationError('item_id or blog_id is required')
+        return attrs
@@ -0,0 +1,9 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .uploads import release_image
+
+@receiver(post_delete, sender='item.Item')
+@receiver(post_delete, sender='community.Blog')
+def release_deleted_image(sender, instance, **kwargs):
+    """Deleting the last Item or Blog showing a photo deletes it from storage"""
+    release_image(instance.image.name)
@@ -0,0 +1,30 @@
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+STREAM_CHUNK_SIZE = 500
+
+def streaming_json_response(key, queryset, serialize, count=False, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Stream {key: [serialize(row), ...]} (followed by "count" when count=True) as JSON.
+
+    Rows are fetched with queryset.iterator(chunk_size) and sent one chunk at a time,
+    so memory use does not grow with the table. The body is byte-for-byte what
+    JsonResponse would produce for the same dict.
+    """
+    def chunks():
+        yield '{' + json.dumps(key) + ': ['
+        total = 0
+        batch = []
+        for row in queryset.iterator(chunk_size=chunk_size):
+            batch.append(json.dumps(serialize(row), cls=DjangoJSONEncoder))
+            if len(batch) == chunk_size:
+                yield (', ' if total else '') + ', '.join(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            yield (', ' if total else '') + ', '.join(batch)
+            total += len(batch)
+        yield ']' + (f', "count": {total}' if count else '') + '}'
+
+    return StreamingHttpResponse(chunks(), content_type='application/json')
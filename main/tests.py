@@ -1,3 +1,226 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+import uuid
+from unittest import mock
+from django.db import transaction
+from decimal import Decimal
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase
+from PIL import Image
+from rest_framework.test import APIClient
+from agent.models import Agent
+from item.models import Item
+from member.models import Member
+from .models import StoredImage
+from .direct_uploads import upload_key
+from .images import decode_image, image_names
+from .uploads import _finalize, claim_image, collect_image, run_job
 
-# Create your tests here.
+class UploadJobTests(TransactionTestCase):
+    # The jobs run on worker threads outside any request, so they commit and close connections themselves
+
+    def setUp(self):
+        agent = Agent.objects.create(user=Member.objects.create(username='seller', email='seller@example.com'), description='')
+        self.item = Item.objects.create(
+            name='Oil', description='', price=10, stock=1, category='waste_oil', agent=agent,
+            image_status='pending', image_pending='abc/digest',
+        )
+
+    def test_an_unexpected_error_marks_the_image_failed(self):
+        job = mock.Mock(side_effect=RuntimeError('boom'))
+        with self.assertLogs('main.uploads', 'ERROR'):
+            run_job(job, 'item.Item', self.item.pk, 'abc/digest')
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.image_status, self.item.image_pending), ('failed', ''))
+
+    def test_a_superseded_upload_is_left_alone(self):
+        with self.assertLogs('main.uploads', 'ERROR'):
+            run_job(mock.Mock(side_effect=RuntimeError('boom')), 'item.Item', self.item.pk, 'older/digest')
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.image_status, 'pending')
+
+    def test_claiming_bytes_claimed_concurrently_shares_the_claim(self):
+        StoredImage.objects.create(digest='d', name='photos/d/large.webp', variants={})
+        # This worker saw no row for the digest before claiming it
+        with transaction.atomic():
+            stored = claim_image('d')
+        self.assertEqual(stored.digest, 'd')
+        self.assertEqual(StoredImage.objects.count(), 1)
+
+class TruncatedImageTests(TransactionTestCase):
+    # The upload job commits and closes its connection, so it can't run inside TestCase's transaction
+
+    def setUp(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), 'green').save(buffer, 'JPEG')
+        # The header is intact, so the cheap check at upload time lets it through
+        self.truncated = buffer.getvalue()[:len(buffer.getvalue()) // 2]
+        self.member = Member.objects.create(username='seller', email='seller@example.com')
+
+    def test_decoding_a_truncated_image_is_invalid(self):
+        with self.assertRaises(ValueError):
+            decode_image(io.BytesIO(self.truncated))
+
+    def test_a_posted_truncated_image_fails_without_retrying(self):
+        client = APIClient()
+        client.force_authenticate(self.member)
+        scratch = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, scratch, ignore_errors=True)
+        executor = mock.Mock(submit=lambda job, *args: job(*args))
+        storage = mock.Mock()
+        with self.settings(IMAGE_SCRATCH_DIR=scratch), \
+                mock.patch('main.uploads.upload_executor', return_value=executor), \
+                mock.patch('main.images.image_storage', return_value=storage), \
+                mock.patch('main.uploads.image_storage', return_value=storage), \
+                mock.patch('main.uploads.time.sleep') as sleep:
+            response = client.post('/item/add/', {
+                'product_title': 'Oil', 'quantity': 1, 'waste_category': 'waste_oil',
+                'image': SimpleUploadedFile('oil.jpg', self.truncated, content_type='image/jpeg'),
+            })
+        self.assertEqual(response.status_code, 200)
+        item = Item.objects.get()
+        self.assertEqual((item.image_status, item.image_pending), ('failed', ''))
+        sleep.assert_not_called()
+        storage.save.assert_not_called()
+
+class ImageCollectionTests(TransactionTestCase):
+    # Releasing, collecting and finalizing run on different workers; each step here commits on its own
+
+    def setUp(self):
+        agent = Agent.objects.create(user=Member.objects.create(username='seller', email='seller@example.com'), description='')
+        self.names = image_names('d')
+        self.stored = StoredImage.objects.create(digest='d', name=self.names['large'], variants=self.names, refcount=1)
+        self.old = Item.objects.create(name='Old', description='', price=10, stock=1, category='waste_oil', agent=agent, image=self.names['large'], image_variants=self.names)
+        self.new = Item.objects.create(
+            name='New', description='', price=10, stock=1, category='waste_oil', agent=agent,
+            image_status='pending', image_pending='abc/d',
+        )
+        self.jobs = []
+        self.storage = mock.Mock()
+        for target, value in (('upload_executor', mock.Mock(return_value=mock.Mock(submit=self.submit))), ('image_storage', mock.Mock(return_value=self.storage))):
+            patcher = mock.patch(f'main.uploads.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def submit(self, job, *args):
+        self.jobs.append((job, args))
+
+    def run_jobs(self):
+        while self.jobs:
+            job, args = self.jobs.pop(0)
+            job(*args)
+
+    def finalize(self, upload):
+        scratch = tempfile.mkdtemp()
+        with mock.patch('main.uploads.upload_image', side_effect=upload) as upload_image:
+            _finalize(Item, self.new.pk, 'abc/d', os.path.join(scratch, 'd'), 'd')
+        self.new.refresh_from_db()
+        return upload_image.call_count
+
+    def test_reuploading_bytes_released_before_their_collection_keeps_them(self):
+        self.old.delete()
+        # The collection is queued; the same bytes are finalized before it runs
+        self.assertEqual(self.finalize(lambda path, digest: self.names), 0)
+        self.run_jobs()
+
+        self.storage.delete.assert_not_called()
+        self.assertEqual(StoredImage.objects.get(digest='d').refcount, 1)
+        self.assertEqual((self.new.image.name, self.new.image_status), (self.names['large'], 'ready'))
+
+    def test_bytes_collected_during_their_upload_are_uploaded_again(self):
+        self.old.delete()
+        self.run_jobs()
+        self.assertFalse(StoredImage.objects.exists())
+        self.storage.reset_mock()
+
+        attempts = []
+        def upload(path, digest):
+            if not attempts:
+                # Another worker's discarded upload of the same bytes is collected meanwhile, deleting what this one wrote
+                collect_image(digest)
+            attempts.append(path)
+            return self.names
+
+        self.assertEqual(self.finalize(upload), 2)
+        self.assertEqual(self.storage.delete.call_count, len(self.names))
+        stored = StoredImage.objects.get(digest='d')
+        self.assertEqual((stored.refcount, stored.variants), (1, self.names))
+        self.assertEqual((self.new.image.name, self.new.image_status), (self.names['large'], 'ready'))
+
+class ConditionalTests(TestCase):
+    def setUp(self):
+        self.seller = Member.objects.create(username='seller', email='seller@example.com')
+        self.item = Item.objects.create(name='Oil', description='', price=Decimal('10.00'), stock=1, category='waste_oil', member=self.seller)
+        self.client = APIClient()
+        self.url = f'/item/{self.item.id}/'
+
+    def test_matching_etag_is_not_modified_until_the_data_changes(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+        self.assertIn('no-cache', first['Cache-Control'])
+
+        # One lookup for the version, and the view doesn't run
+        with self.assertNumQueries(1):
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], etag)
+        self.assertEqual(cached.content, b'')
+
+        self.item.price = Decimal('12.00')
+        self.item.save()
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=changed['ETag']).status_code, 304)
+
+    def test_listing_etag_changes_when_an_item_is_deleted(self):
+        self.client.force_authenticate(self.seller)
+        Item.objects.create(name='Drum', description='', price=Decimal('20.00'), stock=1, category='waste_oil', member=self.seller)
+        etag = self.client.get('/item/my/')['ETag']
+        self.assertEqual(self.client.get('/item/my/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.item.delete()
+        response = self.client.get('/item/my/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('private', response['Cache-Control'])
+
+class ConfirmUploadTests(TestCase):
+    def setUp(self):
+        self.member = Member.objects.create(username='seller', email='seller@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.member)
+        self.upload_id = uuid.uuid4().hex
+        self.url = f'/api/uploads/{self.upload_id}/confirm/'
+
+    def test_ids_must_be_integers(self):
+        for body in ({'item_id': 'abc'}, {'blog_id': '1; drop'}, {'item_id': 1.5}, {'item_id': 0}, {}):
+            response = self.client.post(self.url, body, format='json')
+            self.assertEqual(response.status_code, 400, body)
+            self.assertEqual(response.json()['status'], 'error')
+
+    def test_unknown_item_is_not_found(self):
+        self.assertEqual(self.client.post(self.url, {'item_id': '999'}, format='json').status_code, 404)
+
+    def test_confirming_twice_queues_one_job(self):
+        item = Item.objects.create(name='Oil', description='', price=10, stock=1, category='waste_oil', member=self.member)
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        path = os.path.join(root, upload_key(self.member.id, self.upload_id))
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as upload:
+            upload.write(b'photo')
+
+        with self.settings(DIRECT_UPLOAD_BACKEND='local', DIRECT_UPLOAD_ROOT=root), \
+                mock.patch('main.uploads.upload_executor') as executor, \
+                self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post(self.url, {'item_id': item.id}, format='json')
+            # A client retrying the same confirm
+            retry = self.client.post(self.url, {'item_id': item.id}, format='json')
+        self.assertEqual((first.status_code, retry.status_code), (200, 409))
+        self.assertEqual(executor.return_value.submit.call_count, 1)
+        item.refresh_from_db()
+        self.assertEqual((item.image_status, item.image_pending), ('pending', f'direct/{self.upload_id}'))
@@ -0,0 +1,254 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from .direct_uploads import direct_uploads
+from .images import MAIN_SIZE, check_image, image_names, image_storage, store_image
+from .models import StoredImage
+
+logger = logging.getLogger(__name__)
+
+RETRY_DELAY = 2  # seconds before the first retry; doubled for every further attempt
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def upload_executor():
+    """Process-wide worker pool; its size bounds the number of concurrent uploads"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_UPLOAD_WORKERS, thread_name_prefix='image-upload')
+    return _executor
+
+def scratch_path(token):
+    return os.path.join(settings.IMAGE_SCRATCH_DIR, token)
+
+def stage_image(instance, upload):
+    """
+    Write an uploaded photo to local scratch, hashing it on the way, and mark
+    instance's image as pending. The caller saves instance and then calls
+    enqueue_image(instance). Raises ValueError when the file is not an image.
+    """
+    check_image(upload)
+    staging = os.path.join(settings.IMAGE_SCRATCH_DIR, uuid.uuid4().hex)
+    os.makedirs(staging)
+    digest = hashlib.sha256()
+    with open(os.path.join(staging, 'upload'), 'wb') as scratch:
+        for chunk in upload.chunks():
+            digest.update(chunk)
+            scratch.write(chunk)
+    # The token names the scratch file and carries the content hash
+    token = f"{os.path.basename(staging)}/{digest.hexdigest()}"
+    os.rename(os.path.join(staging, 'upload'), scratch_path(token))
+    instance.image_status = 'pending'
+    instance.image_pending = token
+
+def enqueue_image(instance):
+    """Hand the staged photo of instance to the upload workers once the current transaction commits"""
+    label, pk, token = instance._meta.label, instance.pk, instance.image_pending
+    transaction.on_commit(lambda: upload_executor().submit(run_job, finalize_image, label, pk, token))
+
+def run_job(job, label, pk, token, *args):
+    """
+    Run a finalize job on an upload worker. Nobody waits on the worker's future, so an
+    unexpected error is logged here and marks the image failed rather than leaving it pending.
+    """
+    try:
+        job(label, pk, token, *args)
+    except Exception:
+        logger.exception(f"Image job for {label} {pk} failed")
+        try:
+            mark_failed(apps.get_model(label), pk, token)
+        except Exception:
+            logger.exception(f"Could not mark the image of {label} {pk} as failed")
+    finally:
+        close_old_connections()
+
+def mark_failed(model, pk, token):
+    """Mark the row's staged image failed, unless a newer upload replaced it meanwhile"""
+    with transaction.atomic():
+        instance = model.objects.select_for_update().filter(pk=pk, image_pending=token).first()
+        if instance is not None:
+            instance.image_status = 'failed'
+            instance.image_pending = ''
+            instance.save(update_fields=['image_status', 'image_pending'])
+
+def upload_image(path, digest):
+    """Process and store a staged photo, retrying failures; returns its names or None"""
+    for attempt in range(settings.IMAGE_UPLOAD_ATTEMPTS):
+        try:
+            with open(path, 'rb') as scratch:
+                return store_image(File(scratch, name=digest), digest)
+        except ValueError:
+            return None  # Not an image; retrying won't help
+        except Exception:
+            logger.exception(f"Image upload {digest} failed (attempt {attempt + 1})")
+            if attempt + 1 < settings.IMAGE_UPLOAD_ATTEMPTS:
+                time.sleep(RETRY_DELAY * 2 ** attempt)
+    return None
+
+def finalize_image(label, pk, token):
+    """Worker job for a photo staged by stage_image"""
+    path = scratch_path(token)
+    _finalize(apps.get_model(label), pk, token, path, os.path.basename(path))
+
+def _finalize(model, pk, token, path, digest):
+    """
+    Point the row at the photo in scratch at path unless a newer upload replaced it meanwhile.
+    A photo whose bytes are already stored is shared without processing or uploading it again.
+
+    Before uploading, the worker claims the digest with a StoredImage row that has no variants
+    yet. collect_image only deletes objects while holding that row's lock and deletes the row
+    with them, so finding the same claim row after the upload proves nothing was deleted meanwhile.
+    """
+    names, claim = None, None
+    try:
+        while True:
+            with transaction.atomic():
+                instance = model.objects.select_for_update().filter(pk=pk, image_pending=token).first()
+                stored = StoredImage.objects.select_for_update().filter(digest=digest).first()
+                if instance is None:
+                    if claim is not None:
+                        discard_unreferenced(digest)
+                    return  # Deleted, or superseded by a newer upload
+                uploaded = claim is not None and stored is not None and stored.pk == claim
+                if uploaded and not stored.variants and names is not None:
+                    stored.variants = names
+                    stored.save(update_fields=['variants'])
+                if stored is not None and stored.variants:
+                    previous = instance.image.name
+                    instance.image.name, instance.image_variants = acquire_image(stored)
+                    instance.image_status = 'ready'
+                    release_image(previous)
+                    instance.image_pending = ''
+                    instance.save(update_fields=['image', 'image_variants', 'image_status', 'image_pending'])
+                    return
+                if uploaded:
+                    instance.image_status = 'failed'
+                    instance.image_pending = ''
+                    instance.save(update_fields=['image_status', 'image_pending'])
+                    discard_unreferenced(digest)
+                    return
+                # Not stored yet, or our claim was collected meanwhile: claim it (again) and upload
+                claim = (stored or claim_image(digest)).pk
+            names = upload_image(path, digest)
+    finally:
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+        close_old_connections()
+
+def direct_upload_token(upload_id):
+    return f"direct/{upload_id}"
+
+def stage_direct_upload(instance, upload_id):
+    """Mark instance's image as pending on a photo the client uploaded straight to storage"""
+    instance.image_status = 'pending'
+    instance.image_pending = direct_upload_token(upload_id)
+
+def enqueue_direct_upload(instance, key):
+    """Hand the direct upload at key to the upload workers once the current transaction commits"""
+    label, pk, token = instance._meta.label, instance.pk, instance.image_pending
+    transaction.on_commit(lambda: upload_executor().submit(run_job, finalize_direct_upload, label, pk, token, key))
+
+def finalize_direct_upload(label, pk, token, key):
+    """Worker job for a direct upload: copy it into scratch, hashing it on the way, then finalize it like any other"""
+    uploads = direct_uploads()
+    staging = os.path.join(settings.IMAGE_SCRATCH_DIR, uuid.uuid4().hex)
+    os.makedirs(staging)
+    digest = hashlib.sha256()
+    try:
+        with uploads.storage.open(key, 'rb') as source, open(os.path.join(staging, 'upload'), 'wb') as scratch:
+            for chunk in source.chunks():
+                digest.update(chunk)
+                scratch.write(chunk)
+    except Exception:
+        logger.exception(f"Could not fetch direct upload {key}")
+        shutil.rmtree(staging, ignore_errors=True)
+        mark_failed(apps.get_model(label), pk, token)
+        close_old_connections()
+        return
+    path = os.path.join(staging, digest.hexdigest())
+    os.rename(os.path.join(staging, 'upload'), path)
+    # The raw upload is never served; only its processed variants are kept
+    delete_objects([key], uploads.storage)
+    _finalize(apps.get_model(label), pk, token, path, digest.hexdigest())
+
+def claim_image(digest):
+    """The locked StoredImage row of digest, created without variants when there is none yet"""
+    try:
+        with transaction.atomic():
+            return StoredImage.objects.create(digest=digest, name=image_names(digest)[MAIN_SIZE], variants={})
+    except IntegrityError:
+        # Another worker claimed the same bytes meanwhile
+        return StoredImage.objects.select_for_update().get(digest=digest)
+
+def acquire_image(stored):
+    """Count one more reference to a stored photo; returns (main name, variants)"""
+    StoredImage.objects.filter(pk=stored.pk).update(refcount=F('refcount') + 1)
+    return stored.name, stored.variants
+
+def release_image(name):
+    """
+    Drop one reference to the stored photo called name (the main image name).
+    The last reference leaves it to collect_image once the transaction commits.
+    Images stored before content addressing are not tracked and are left alone.
+    """
+    if not name:
+        return
+    with transaction.atomic():
+        stored = StoredImage.objects.select_for_update().filter(name=name).first()
+        if stored is None:
+            return
+        StoredImage.objects.filter(pk=stored.pk).update(refcount=F('refcount') - 1)
+        if stored.refcount == 1:
+            discard_unreferenced(stored.digest)
+
+def discard_unreferenced(digest):
+    """Have the workers delete the photo stored for digest once the transaction commits, unless it is referenced again by then"""
+    transaction.on_commit(lambda: upload_executor().submit(run_collect, digest))
+
+def run_collect(digest):
+    try:
+        collect_image(digest)
+    except Exception:
+        logger.exception(f"Could not collect image {digest}")
+    finally:
+        close_old_connections()
+
+def collect_image(digest):
+    """
+    Delete an unreferenced photo's objects and then its StoredImage row, holding the row's lock
+    throughout so a worker about to share or upload the same bytes waits for it.
+    """
+    with transaction.atomic():
+        stored = StoredImage.objects.select_for_update().filter(digest=digest).first()
+        if stored is None or stored.refcount > 0:
+            return
+        # A claim has no variants yet, but its upload may have written some of them
+        delete_objects(list((stored.variants or image_names(digest)).values()))
+        stored.delete()
+
+def delete_objects(names, storage=None):
+    storage = storage or image_storage()
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception:
+            logger.exception(f"Could not delete image {name}")
+
+def pending_images():
+    """(label, pk, token) of the staged photos whose scratch file still exists, e.g. after a restart"""
+    for label in ('item.Item', 'community.Blog'):
+        rows = apps.get_model(label).objects.filter(image_status='pending').exclude(image_pending='')
+        for pk, token in rows.values_list('pk', 'image_pending'):
+            if os.path.exists(scratch_path(token)):
+                yield label, pk, token
@@ -3,4 +3,7 @@ from . import views
 
 urlpatterns = [
     path('test/', views.test_endpoint, name='test_endpoint'),
+    path('uploads/', views.create_upload, name='create_upload'),
+    path('uploads/<str:upload_id>/confirm/', views.confirm_upload, name='confirm_upload'),
+    path('uploads/local/<str:token>/', views.local_upload, name='local_upload'),
 ]
@@ -1,5 +1,19 @@
+import re
+import uuid
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from .direct_uploads import LocalDirectUploads, direct_uploads, upload_key
+from .serializers import ConfirmUploadSerializer
+from .uploads import direct_upload_token, enqueue_direct_upload, stage_direct_upload
+
+IMAGE_CONTENT_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/gif')
 
 # Create your views here.
 
@@ -13,3 +27,76 @@ def test_endpoint(request):
         'timestamp': '2025-07-24',
         'method': request.method
     })
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+def create_upload(request):
+    """Presign a direct-to-storage upload of a photo (see main.direct_uploads for the whole flow)"""
+    content_type = request.data.get('content_type', '')
+    if content_type not in IMAGE_CONTENT_TYPES:
+        return JsonResponse({"status": "error", "message": f"content_type must be one of {', '.join(IMAGE_CONTENT_TYPES)}"}, status=400)
+
+    upload_id = uuid.uuid4().hex
+    grant = direct_uploads().presign(upload_key(request.user.id, upload_id), content_type, request)
+    return JsonResponse({
+        "status": "success",
+        "upload_id": upload_id,
+        **grant,
+        "max_size": settings.DIRECT_UPLOAD_MAX_SIZE,
+        "expires_in": settings.DIRECT_UPLOAD_EXPIRY,
+    })
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+def confirm_upload(request, upload_id):
+    """Use a finished direct upload as the photo of one of the user's items (item_id) or blogs (blog_id)"""
+    from item.models import Item
+    from community.models import Blog
+    user = request.user
+    if not re.fullmatch(r'[0-9a-f]{32}', upload_id):
+        return JsonResponse({"status": "error", "message": "Upload not found"}, status=404)
+
+    serializer = ConfirmUploadSerializer(data=request.data)
+    if not serializer.is_valid():
+        return JsonResponse({"status": "error", "message": "item_id or blog_id is required and must be an integer", "errors": serializer.errors}, status=400)
+    target = serializer.validated_data
+    if 'item_id' in target:
+        instance = Item.objects.filter(Q(agent__user=user) | Q(member=user), id=target['item_id']).first()
+    else:
+        instance = Blog.objects.filter(user=user, id=target['blog_id']).first()
+    if instance is None:
+        return JsonResponse({"status": "error", "message": "Item or blog not found or you don't have permission to edit it"}, status=404)
+
+    key = upload_key(user.id, upload_id)
+    try:
+        size = direct_uploads().storage.size(key)
+    except Exception:
+        return JsonResponse({"status": "error", "message": "Upload not found"}, status=404)
+    if size > settings.DIRECT_UPLOAD_MAX_SIZE:
+        return JsonResponse({"status": "error", "message": "Upload is too large"}, status=400)
+
+    with transaction.atomic():
+        instance = type(instance).objects.select_for_update().get(pk=instance.pk)
+        # A retried confirm would queue a second job for the same token, which fails once the first has consumed the upload
+        if instance.image_pending == direct_upload_token(upload_id):
+            return JsonResponse({"status": "error", "message": "Upload is already being processed"}, status=409)
+        stage_direct_upload(instance, upload_id)
+        instance.save(update_fields=['image_status', 'image_pending'])
+        enqueue_direct_upload(instance, key)
+    return JsonResponse({"status": "success", "image_status": instance.image_status})
+
+@csrf_exempt
+@require_http_methods(['PUT'])
+def local_upload(request, token):
+    """Storage side of a presigned PUT, for the local stand-in only"""
+    uploads = direct_uploads()
+    if not isinstance(uploads, LocalDirectUploads):
+        return HttpResponse(status=404)
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return HttpResponse(status=400)
+    error = uploads.receive(token, request.content_type, request, length)
+    return HttpResponse(status=error or 200)
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from transaction.wallet import with_wallet_balance
 from .models import Member, Waste
 
 @admin.register(Member)
@@ -40,6 +41,13 @@ class MemberAdmin(admin.ModelAdmin):
         "google_id",
     )
 
+    def get_queryset(self, request):
+        return with_wallet_balance(super().get_queryset(request))
+
+    def wallet(self, obj):
+        return obj.balance
+    wallet.admin_order_field = 'balance'
+
 @admin.register(Waste)
 class WasteAdmin(admin.ModelAdmin):
     list_display = ('id', 'member_email', 'waste_type', 'quantity', 'status', 'location', 'created_at')
@@ -1,32 +1,33 @@
-# Utility function for distance calculation
-from math import radians, cos, sin, asin, sqrt
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from main.geo import nearest, queryset_candidates
+from main.pagination import encode_cursor, get_distance_cursor, get_page_size
 from .models import Member
 
-def haversine(lat1, lon1, lat2, lon2):
-    """Calculate the great circle distance between two points on the earth (specified in decimal degrees)"""
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    r = 6371  # Radius of earth in kilometers
-    return c * r
-
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def nearest_members(request):
-    """Get nearest members based on user's location"""
+    """Get nearest members based on user's location, paginated by (distance, id) with an opaque next_cursor"""
     user = request.user
     if not user.latitude or not user.longitude:
         return Response({'error': 'Your location is not set.'}, status=400)
-    
+
+    try:
+        limit = get_page_size(request)
+        after = get_distance_cursor(request)
+    except ValueError:
+        return Response({'error': 'Invalid limit or cursor.'}, status=400)
+
     members = Member.objects.exclude(id=user.id).exclude(latitude__isnull=True).exclude(longitude__isnull=True)
+    # One extra row tells us whether there is a next page
+    ranked = nearest(queryset_candidates(members), user.latitude, user.longitude, limit=limit + 1, after=after)
+    page = ranked[:limit]
+    members_by_id = members.select_related('agent').in_bulk([member_id for _, member_id in page])
+
     results = []
-    for member in members:
-        dist = haversine(user.latitude, user.longitude, member.latitude, member.longitude)
+    for dist, member_id in page:
+        member = members_by_id[member_id]
         results.append({
             'id': member.id,
             'username': member.username,
@@ -38,6 +39,8 @@ def nearest_members(request):
             'gender': member.gender,
             'is_agent': hasattr(member, 'agent')
         })
-    
-    results.sort(key=lambda x: x['distance_km'])
-    return Response({'nearest_members': results})
+
+    return Response({
+        'nearest_members': results,
+        'next_cursor': encode_cursor(*page[-1]) if len(ranked) > limit else None,
+    })
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:02
+
+from django.db import migrations, models
+
+from main.geo import encode_geohash
+
+
+def populate_geohash(apps, schema_editor):
+    Member = apps.get_model('member', 'Member')
+    members = Member.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    for member in members.iterator():
+        member.geohash = encode_geohash(member.latitude, member.longitude)
+        member.save(update_fields=['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('member', '0002_member_address_id_member_gender_member_latitude_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='member',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12, null=True),
+        ),
+        migrations.RunPython(populate_geohash, migrations.RunPython.noop),
+    ]
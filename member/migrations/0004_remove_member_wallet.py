@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:27
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('member', '0003_member_geohash'),
+        ('transaction', '0004_wallet_ledger'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='member',
+            name='wallet',
+        ),
+    ]
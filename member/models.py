@@ -1,14 +1,15 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from main.geo import encode_geohash
 
 class Member(AbstractUser):
     email = models.EmailField(unique=True)
     phone_number = models.CharField(max_length=20, unique=True, blank=True, null=True)
     points = models.IntegerField(default=0)
-    wallet = models.DecimalField(max_digits=12, decimal_places=2, default=100000.00)
     alamat = models.TextField(blank=True, null=True)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, null=True, db_index=True)
     email_verified = models.BooleanField(default=False)
     verification_token = models.CharField(max_length=64, blank=True, null=True)
     address_id = models.CharField(max_length=255, blank=True, null=True)
@@ -27,6 +28,41 @@ class Member(AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so post_save receivers can tell what changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def has_changed(self, *fields):
+        """Whether any of the given fields differs from the value loaded from the database"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return True
+        return any(field not in loaded or loaded[field] != getattr(self, field) for field in fields)
+
+    def save(self, *args, **kwargs):
+        # Keep the spatial index cell in sync with the coordinates
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+        else:
+            self.geohash = None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+        saved = set(kwargs['update_fields']) if kwargs.get('update_fields') is not None else None
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {
+            **getattr(self, '_loaded_values', {}),
+            **{
+                field.attname: getattr(self, field.attname)
+                for field in self._meta.concrete_fields
+                if field.attname not in deferred and (saved is None or field.name in saved)
+            },
+        }
+
     def __str__(self):
         return self.email
 
@@ -2,10 +2,14 @@ from rest_framework import serializers
 from django.contrib.auth import authenticate
 from .models import Member
 from agent.models import Agent
+from transaction.wallet import wallet_balance
+
+WALLET_FORMAT = serializers.DecimalField(max_digits=12, decimal_places=2)
 
 class MemberSerializer(serializers.ModelSerializer):
     """Serializer untuk Member model"""
     is_agent = serializers.SerializerMethodField()
+    wallet = serializers.SerializerMethodField()
     
     class Meta:
         model = Member
@@ -19,6 +23,13 @@ class MemberSerializer(serializers.ModelSerializer):
         """Check if user has an agent profile"""
         return hasattr(obj, 'agent')
 
+    def get_wallet(self, obj):
+        """Balance from the wallet ledger, as a string like the old wallet column (annotate querysets with with_wallet_balance to skip the lookup)"""
+        balance = getattr(obj, 'balance', None)
+        if balance is None:
+            balance = wallet_balance(obj.pk)
+        return WALLET_FORMAT.to_representation(balance)
+
 class MemberRegistrationSerializer(serializers.ModelSerializer):
     """Serializer untuk registrasi member baru"""
     password = serializers.CharField(write_only=True, min_length=8)
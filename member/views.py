@@ -17,6 +17,7 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework_simplejwt.tokens import RefreshToken
 from .serializers import MemberSerializer, MemberRegistrationSerializer, LoginSerializer
 from .utils import generate_tokens_for_user, send_verification_email
+from transaction.wallet import with_wallet_balance
 
 from google.auth.transport import requests as google_requests
 from google.oauth2 import id_token
@@ -523,7 +524,7 @@ class GoogleOAuthCallbackAPIView(APIView):
 def get_member_profile(request, member_id):
     """Get member profile by ID"""
     try:
-        member = Member.objects.get(id=member_id)
+        member = with_wallet_balance(Member.objects).get(id=member_id)
         serializer = MemberSerializer(member)
         return Response(serializer.data)
     except Member.DoesNotExist:
@@ -538,7 +539,7 @@ def get_agent_profile(request, agent_id):
     try:
         from agent.models import Agent
         agent = Agent.objects.select_related('user').get(id=agent_id)
-        member_serializer = MemberSerializer(agent.user)
+        member_serializer = MemberSerializer(with_wallet_balance(Member.objects).get(pk=agent.user_id))
         
         response_data = member_serializer.data
         response_data['agent_id'] = agent.id
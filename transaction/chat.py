@@ -0,0 +1,51 @@
+import time
+from django.conf import settings
+from django.db import connection
+from main.events import broker, sse_event
+from .models import Message
+
+# Messages travel as the dict of MESSAGE_FIELDS, whether read from the database or
+# published by the post_save receiver, and get their sender's name when serialized
+
+MESSAGE_FIELDS = ('id', 'content', 'sender_is_agent', 'created_at')
+RECONNECT_DELAY = 3000  # milliseconds a disconnected client waits before reconnecting
+
+def offer_channel(offer_id):
+    return f"offer:{offer_id}"
+
+def sender_names(offer):
+    """Display names of the offer's two sides, keyed by sender_is_agent"""
+    return {True: offer.agent.user.username, False: offer.member.username}
+
+def serialize_message(row, senders):
+    return {
+        "id": row['id'],
+        "content": row['content'],
+        "sender": senders[row['sender_is_agent']],
+        "sender_type": "agent" if row['sender_is_agent'] else "member",
+        "created_at": row['created_at'].strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+def message_events(offer, last_id):
+    """
+    Server-Sent Events for the offer's messages after last_id: first the ones already
+    stored, then each new one as it is published, until SSE_MAX_DURATION has passed.
+    """
+    senders = sender_names(offer)
+    deadline = time.monotonic() + settings.SSE_MAX_DURATION
+    with broker().subscribe(offer_channel(offer.id)) as subscription:
+        yield f"retry: {RECONNECT_DELAY}\n\n"
+        # Subscribed before reading, so a message committed meanwhile is either read here or queued
+        for row in Message.objects.filter(offer=offer, id__gt=last_id).order_by('id').values(*MESSAGE_FIELDS):
+            last_id = row['id']
+            yield sse_event(serialize_message(row, senders), event='message', event_id=row['id'])
+        # Waiting for messages doesn't need the database
+        if not connection.in_atomic_block:
+            connection.close()
+        while (remaining := deadline - time.monotonic()) > 0:
+            row = subscription.get(timeout=min(settings.SSE_HEARTBEAT, remaining))
+            if row is None:
+                yield ": keep-alive\n\n"
+            elif row['id'] > last_id:
+                last_id = row['id']
+                yield sse_event(serialize_message(row, senders), event='message', event_id=row['id'])
@@ -0,0 +1,58 @@
+from datetime import datetime, time, timedelta
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from main.pagination import encode_cursor, get_page_size, get_time_cursor
+from .models import Transaction
+
+# Transaction history pages newest first, by (created_at, id) keyset over the
+# (member | agent, created_at, id) indexes, so any page costs the same
+
+def _parse_moment(value, end_of_day=False):
+    """A date (the start of that day, or of the next one with end_of_day) or a datetime, as an aware datetime"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value}")
+        moment = datetime.combine(day + timedelta(days=1) if end_of_day else day, time.min)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+def parse_history_filters(params):
+    """
+    Q for the date_from, date_to (inclusive), status and type query parameters.
+    Raises ValueError on an invalid value.
+    """
+    q = Q()
+    if params.get('date_from'):
+        q &= Q(created_at__gte=_parse_moment(params['date_from']))
+    if params.get('date_to'):
+        value = params['date_to']
+        # A bare date includes the whole day
+        q &= Q(created_at__lt=_parse_moment(value, end_of_day=True)) if parse_datetime(value) is None else Q(created_at__lte=_parse_moment(value))
+    if params.get('status'):
+        if params['status'] not in dict(Transaction.STATUS_CHOICES):
+            raise ValueError(f"Invalid status: {params['status']}")
+        q &= Q(status=params['status'])
+    if params.get('type'):
+        if params['type'] not in dict(Transaction.TRANSACTION_TYPE_CHOICES):
+            raise ValueError(f"Invalid type: {params['type']}")
+        q &= Q(transaction_type=params['type'])
+    return q
+
+def history_page(transactions, request):
+    """
+    One page of transactions matching the request's filters, newest first, and the cursor
+    of the next page (None on the last one). Raises ValueError on invalid parameters.
+    """
+    limit = get_page_size(request)
+    after = get_time_cursor(request)
+    transactions = transactions.filter(parse_history_filters(request.GET))
+    if after is not None:
+        created_at, row_id = after
+        transactions = transactions.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=row_id))
+    # One extra row tells us whether there is a next page
+    rows = list(transactions.order_by('-created_at', '-id')[:limit + 1])
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1].created_at.isoformat(), page[-1].id) if len(rows) > limit else None
+    return page, next_cursor
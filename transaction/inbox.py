@@ -0,0 +1,59 @@
+from django.db.models import Count, Exists, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Left
+from main.pagination import encode_cursor, get_page_size, get_time_cursor
+from .models import Message, Offer
+
+# The inbox lists a user's negotiations by their latest offer (the one nothing counters yet),
+# with the message counts, last message and unread count computed by correlated
+# subqueries in the same query, so a page costs one query whatever it holds
+
+PREVIEW_LENGTH = 100
+
+def inbox_offers(user, is_agent):
+    """The latest offer of each of the user's negotiations, annotated for the inbox"""
+    offers = Offer.objects.filter(agent=user.agent) if is_agent else Offer.objects.filter(member=user)
+    messages = Message.objects.filter(offer=OuterRef('pk'))
+    last_message = messages.order_by('-id')
+    # Unread: what the other side sent after the last message this side has seen
+    unread = messages.filter(
+        sender_is_agent=not is_agent,
+        id__gt=OuterRef('agent_last_read' if is_agent else 'member_last_read'),
+    )
+    return (
+        offers
+        .filter(~Exists(Offer.objects.filter(parent_offer=OuterRef('pk'))))
+        .select_related('item', 'member', 'agent__user')
+        .annotate(
+            message_count=Coalesce(Subquery(messages.values('offer').annotate(n=Count('id')).values('n')), 0),
+            unread_count=Coalesce(Subquery(unread.values('offer').annotate(n=Count('id')).values('n')), 0),
+            last_message_preview=Subquery(last_message.values(preview=Left('content', PREVIEW_LENGTH))[:1]),
+            last_message_from_agent=Subquery(last_message.values('sender_is_agent')[:1]),
+            last_message_at=Subquery(last_message.values('created_at')[:1]),
+            last_activity=Coalesce(Subquery(last_message.values('created_at')[:1]), 'created_at'),
+        )
+    )
+
+def inbox_page(offers, request):
+    """
+    One page of inbox rows, most recent activity first, and the next page's cursor.
+    Raises ValueError on an invalid limit, cursor or status.
+    """
+    limit = get_page_size(request)
+    after = get_time_cursor(request)
+    status = request.GET.get('status')
+    if status:
+        if status not in dict(Offer.STATUS_CHOICES):
+            raise ValueError(f"Invalid status: {status}")
+        offers = offers.filter(status=status)
+    if after is not None:
+        last_activity, row_id = after
+        offers = offers.filter(Q(last_activity__lt=last_activity) | Q(last_activity=last_activity, id__lt=row_id))
+    rows = list(offers.order_by('-last_activity', '-id')[:limit + 1])
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1].last_activity.isoformat(), page[-1].id) if len(rows) > limit else None
+    return page, next_cursor
+
+def mark_read(offer, is_agent, message_id):
+    """Record that the user's side of offer has seen its messages up to message_id"""
+    field = 'agent_last_read' if is_agent else 'member_last_read'
+    Offer.objects.filter(pk=offer.pk, **{f'{field}__lt': message_id}).update(**{field: message_id})
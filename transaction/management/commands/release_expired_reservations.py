@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from transaction.reservations import release_expired
+
+class Command(BaseCommand):
+    help = "Delete the cart stock reservations that have expired (run periodically, e.g. from cron)"
+
+    def handle(self, *args, **options):
+        count = release_expired()
+        self.stdout.write(f"Released {count} expired reservation(s)")
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from transaction.wallet import take_snapshots
+
+class Command(BaseCommand):
+    help = "Fold new wallet entries into balance snapshots (run periodically, e.g. from cron)"
+
+    def handle(self, *args, **options):
+        count = take_snapshots()
+        self.stdout.write(f"Snapshotted {count} wallet(s)")
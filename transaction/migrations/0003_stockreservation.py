@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0006_item_image_status'),
+        ('transaction', '0002_transaction_completed_at_transaction_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='transaction.cart')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='item.item')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', 'expires_at'], name='transaction_item_id_4b6ccc_idx'), models.Index(fields=['expires_at'], name='transaction_expires_0b2728_idx')],
+                'constraints': [models.UniqueConstraint(fields=('cart', 'item'), name='unique_cart_item_reservation')],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_wallets(apps, schema_editor):
+    """Carry every member's current wallet over as the opening entry of their ledger"""
+    Member = apps.get_model('member', 'Member')
+    WalletEntry = apps.get_model('transaction', 'WalletEntry')
+    WalletEntry.objects.bulk_create(
+        (WalletEntry(member_id=pk, amount=wallet, kind='opening') for pk, wallet in Member.objects.values_list('pk', 'wallet').iterator()),
+        batch_size=1000,
+    )
+
+
+def close_wallets(apps, schema_editor):
+    Member = apps.get_model('member', 'Member')
+    WalletEntry = apps.get_model('transaction', 'WalletEntry')
+    balances = WalletEntry.objects.values('member').annotate(total=models.Sum('amount')).values_list('member', 'total')
+    for pk, total in balances.iterator():
+        Member.objects.filter(pk=pk).update(wallet=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transaction', '0003_stockreservation'),
+        ('member', '0003_member_geohash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('kind', models.CharField(choices=[('opening', 'Opening balance'), ('payment', 'Payment'), ('receipt', 'Receipt')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wallet_entries', to=settings.AUTH_USER_MODEL)),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='wallet_entries', to='transaction.transaction')),
+            ],
+            options={
+                'verbose_name_plural': 'wallet entries',
+                'indexes': [models.Index(fields=['member', 'id'], name='transaction_member__fa1580_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WalletSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('last_entry', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wallet_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['member', '-last_entry'], name='transaction_member__8a5b7e_idx')],
+            },
+        ),
+        migrations.RunPython(open_wallets, close_wallets),
+    ]
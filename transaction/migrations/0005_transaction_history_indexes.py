@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0001_initial'),
+        ('item', '0006_item_image_status'),
+        ('transaction', '0004_wallet_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['member', '-created_at', '-id'], name='transaction_member__a8d31d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['agent', '-created_at', '-id'], name='transaction_agent_i_0fbaf2_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def link_chains(apps, schema_editor):
+    """Backfill root_offer and depth by following parent_offer in memory"""
+    Offer = apps.get_model('transaction', 'Offer')
+    parents = dict(Offer.objects.values_list('id', 'parent_offer_id'))
+    changed = []
+    for offer_id, parent_id in parents.items():
+        if parent_id is None:
+            continue
+        root_id, depth = parent_id, 1
+        while parents[root_id] is not None:
+            root_id, depth = parents[root_id], depth + 1
+        changed.append(Offer(id=offer_id, root_offer_id=root_id, depth=depth))
+    Offer.objects.bulk_update(changed, ['root_offer', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0001_initial'),
+        ('item', '0006_item_image_status'),
+        ('transaction', '0005_transaction_history_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='offer',
+            name='depth',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='offer',
+            name='root_offer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='transaction.offer'),
+        ),
+        migrations.AddIndex(
+            model_name='offer',
+            index=models.Index(fields=['root_offer', 'depth'], name='transaction_root_of_bd08c2_idx'),
+        ),
+        migrations.RunPython(link_chains, migrations.RunPython.noop),
+    ]
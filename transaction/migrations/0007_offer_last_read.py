@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transaction', '0006_offer_root_offer_depth'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='offer',
+            name='agent_last_read',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='offer',
+            name='member_last_read',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
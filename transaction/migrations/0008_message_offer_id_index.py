@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transaction', '0007_offer_last_read'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['offer', 'id'], name='transaction_offer_i_a1d74a_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_folded(apps, schema_editor):
+    """Entries a snapshot already covers are those up to its last_entry"""
+    WalletEntry = apps.get_model('transaction', 'WalletEntry')
+    WalletSnapshot = apps.get_model('transaction', 'WalletSnapshot')
+    for member_id, last_entry in WalletSnapshot.objects.order_by('last_entry').values_list('member_id', 'last_entry'):
+        WalletEntry.objects.filter(member_id=member_id, id__lte=last_entry).update(folded=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transaction', '0008_message_offer_id_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='walletentry',
+            name='transaction_member__fa1580_idx',
+        ),
+        migrations.AddField(
+            model_name='walletentry',
+            name='folded',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_folded, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='walletentry',
+            index=models.Index(condition=models.Q(('folded', False)), fields=['member'], name='wallet_entry_unfolded_idx'),
+        ),
+    ]
@@ -19,6 +19,26 @@ class CartItem(models.Model):
 
     def __str__(self):
         return f"{self.quantity} x {self.item} in {self.cart}"
+
+class StockReservation(models.Model):
+    """Units of an item held for a cart until expires_at; see transaction.reservations"""
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'item'], name='unique_cart_item_reservation'),
+        ]
+        # Summing an item's active holds, and sweeping expired ones, stay on the index
+        indexes = [
+            models.Index(fields=['item', 'expires_at']),
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.item} held for {self.cart} until {self.expires_at}"
     
 class Transaction(models.Model):
     BUY = 'buy'
@@ -45,6 +65,13 @@ class Transaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        # History pages are keyset ranges on these
+        indexes = [
+            models.Index(fields=['member', '-created_at', '-id']),
+            models.Index(fields=['agent', '-created_at', '-id']),
+        ]
+
     def __str__(self):
         return f"{self.member.email} {self.transaction_type} {self.item} from {self.agent.user.email} - {self.status}"
 
@@ -66,10 +93,40 @@ class Offer(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     sender_is_agent = models.BooleanField(default=True)
     parent_offer = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True)
+    # The first offer of the negotiation (None on that offer itself) and how many counters
+    # deep this one is, so a whole chain is one indexed query; set by save()
+    root_offer = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    depth = models.PositiveIntegerField(default=0)
+    # Id of the last message each side has seen; later ones from the other side are unread
+    member_last_read = models.BigIntegerField(default=0)
+    agent_last_read = models.BigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['root_offer', 'depth']),
+        ]
     
     def __str__(self):
         return f"Offer for {self.item.name} - {self.status}"
+
+    @property
+    def thread_id(self):
+        """Id of the negotiation's first offer"""
+        return self.root_offer_id or self.id
+
+    def save(self, *args, **kwargs):
+        if self.parent_offer_id is not None and self.root_offer_id is None:
+            self.root_offer_id = self.parent_offer.thread_id
+            self.depth = self.parent_offer.depth + 1
+        super().save(*args, **kwargs)
+
+    def negotiation_chain(self):
+        """This offer and the ones it counters, oldest first"""
+        return Offer.objects.filter(
+            models.Q(id=self.thread_id) | models.Q(root_offer_id=self.thread_id),
+            depth__lte=self.depth,
+        ).order_by('depth')
     
 class Message(models.Model):
     offer = models.ForeignKey(Offer, on_delete=models.CASCADE, related_name='messages')
@@ -77,6 +134,64 @@ class Message(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Syncing a conversation after a given message is a range scan on this
+        indexes = [
+            models.Index(fields=['offer', 'id']),
+        ]
+
     def __str__(self):
         sender = "Agent" if self.sender_is_agent else "Member"
-        return f"{sender} message for offer #{self.offer.id}"
\ No newline at end of file
+        return f"{sender} message for offer #{self.offer.id}"
+
+class WalletEntry(models.Model):
+    """
+    One immutable movement on a member's wallet: a credit (positive amount) or a debit (negative).
+    A wallet's balance is its latest WalletSnapshot plus the entries not folded into it; see transaction.wallet.
+    """
+    OPENING = 'opening'
+    PAYMENT = 'payment'
+    RECEIPT = 'receipt'
+    KIND_CHOICES = [
+        (OPENING, 'Opening balance'),
+        (PAYMENT, 'Payment'),
+        (RECEIPT, 'Receipt'),
+    ]
+
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='wallet_entries')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    transaction = models.ForeignKey(Transaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='wallet_entries')
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set by take_snapshots when the entry is folded into a snapshot; nothing else ever changes
+    folded = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name_plural = 'wallet entries'
+        # The tail after a snapshot only covers the few entries not folded yet
+        indexes = [
+            models.Index(fields=['member'], condition=models.Q(folded=False), name='wallet_entry_unfolded_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Wallet entries are immutable; post a correcting entry instead")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.amount:+} {self.kind} on {self.member.email}"
+
+class WalletSnapshot(models.Model):
+    """A member's balance folding in every WalletEntry marked folded; last_entry is the highest of their ids"""
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='wallet_snapshots')
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    last_entry = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['member', '-last_entry']),
+        ]
+
+    def __str__(self):
+        return f"{self.member.email}: {self.balance} through entry {self.last_entry}"
@@ -0,0 +1,37 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import StockReservation
+
+# Putting units in a cart holds them for CART_RESERVATION_TTL seconds, so other carts
+# can't claim the same last units. A hold lapses on its own once expired: it no longer
+# counts against the item's stock, and the release_expired_reservations command sweeps it.
+
+def with_available_stock(items, cart=None):
+    """
+    Annotate items with available: stock minus the units held by active reservations,
+    not counting cart's own holds (annotated as held_for_cart). One aggregate over the
+    (item, expires_at) index.
+    """
+    active = Q(reservations__expires_at__gt=timezone.now())
+    held = Coalesce(Sum('reservations__quantity', filter=active), 0)
+    own = Coalesce(Sum('reservations__quantity', filter=active & Q(reservations__cart=cart)), 0) if cart else Value(0)
+    return items.annotate(held_for_cart=own, available=F('stock') - held + F('held_for_cart'))
+
+def hold(cart, item, quantity):
+    """Hold quantity units of item for cart, replacing any earlier hold and restarting its expiry"""
+    expires_at = timezone.now() + timedelta(seconds=settings.CART_RESERVATION_TTL)
+    StockReservation.objects.update_or_create(cart=cart, item=item, defaults={'quantity': quantity, 'expires_at': expires_at})
+
+def release(cart, item_ids=None):
+    """Drop cart's holds, on all its items or on item_ids only"""
+    holds = StockReservation.objects.filter(cart=cart)
+    if item_ids is not None:
+        holds = holds.filter(item_id__in=item_ids)
+    holds.delete()
+
+def release_expired():
+    """Delete the lapsed holds; returns how many there were"""
+    return StockReservation.objects.filter(expires_at__lte=timezone.now()).delete()[0]
@@ -0,0 +1,42 @@
+from agent.models import Agent
+from item.models import Item
+from .models import Offer, Transaction, WalletEntry
+from .wallet import transfer, wallet_balance
+
+def settle_offer(offer):
+    """
+    Accept offer: the agent buys the member's item at the offered price.
+
+    Call inside an atomic block, with offer already locked. Rows are locked in one fixed
+    order, offer then item then the paying wallet, so concurrent settlements queue up
+    instead of deadlocking. Only the agent's wallet is locked: the member is credited
+    with a ledger insert. Competing pending offers on the item are rejected in one UPDATE.
+    Returns the Transaction; raises ValueError (changing nothing) when the item is no
+    longer available or the agent can't pay.
+    """
+    item = Item.objects.select_for_update().get(pk=offer.item_id)
+    if item.status != 'available':
+        raise ValueError(f"{item.name} is no longer available")
+
+    payer_id = Agent.objects.values_list('user_id', flat=True).get(pk=offer.agent_id)
+    balance = wallet_balance(payer_id, lock=True)
+    if balance < offer.price:
+        raise ValueError(f"Insufficient wallet balance. Required: {offer.price}, Available: {balance}")
+
+    offer.status = 'accepted'
+    offer.save(update_fields=['status'])
+    transaction = Transaction.objects.create(
+        member_id=offer.member_id,
+        agent_id=offer.agent_id,
+        item=item,
+        transaction_type=Transaction.SELL,  # Member selling to agent
+        quantity=int(offer.quantity),  # Converting to int for PositiveIntegerField
+        total_price=offer.price,
+    )
+    # The agent pays the member
+    WalletEntry.objects.bulk_create(transfer(payer_id, offer.member_id, offer.price, transaction))
+
+    item.status = 'sold'
+    item.save(update_fields=['status'])
+    Offer.objects.filter(item=item, status='pending').exclude(pk=offer.pk).update(status='rejected')
+    return transaction
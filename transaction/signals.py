@@ -0,0 +1,22 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from main.events import broker
+from member.models import Member
+from .chat import MESSAGE_FIELDS, offer_channel
+from .models import Message
+from .wallet import open_wallet
+
+@receiver(post_save, sender=Member)
+def open_wallet_of_member(sender, instance, created, raw=False, **kwargs):
+    """Every new member starts with the opening balance"""
+    if created and not raw:
+        open_wallet(instance)
+
+@receiver(post_save, sender=Message)
+def publish_message(sender, instance, created, raw=False, **kwargs):
+    """Push new messages to the offer's open streams once they are committed"""
+    if created and not raw:
+        row = {field: getattr(instance, field) for field in MESSAGE_FIELDS}
+        channel = offer_channel(instance.offer_id)
+        transaction.on_commit(lambda: broker().publish(channel, row))
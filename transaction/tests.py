@@ -1,3 +1,415 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from agent.models import Agent
+from item.models import Item
+from main.pagination import encode_cursor
+from member.models import Member
+from .models import Cart, CartItem, Message, Offer, StockReservation, Transaction, WalletEntry, WalletSnapshot
+from .reservations import hold, with_available_stock
+from .wallet import take_snapshots, transfer, wallet_balance
 
-# Create your tests here.
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.member = Member.objects.create(username='buyer', email='buyer@example.com')
+        seller = Member.objects.create(username='seller', email='seller@example.com')
+        self.agent = Agent.objects.create(user=seller, description='')
+        self.client = APIClient()
+        self.client.force_authenticate(self.member)
+
+    def fill_cart(self, lines, stock=5, quantity=2):
+        cart = Cart.objects.create(member=self.member, agent=self.agent)
+        items = [
+            Item.objects.create(name=f'Oil {i}', description='', price=Decimal('10.00'), stock=stock, category='waste_oil', agent=self.agent)
+            for i in range(lines)
+        ]
+        CartItem.objects.bulk_create([CartItem(cart=cart, item=item, quantity=quantity) for item in items])
+        for item in items:
+            hold(cart, item, quantity)
+        return items
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        # cart, cart lines, items with their holds, wallet lock, stock update, transactions insert,
+        # wallet entries insert, cart clear, holds release, plus the view's savepoint and its release
+        for lines in (1, 30):
+            Cart.objects.filter(member=self.member).delete()
+            self.fill_cart(lines)
+            with self.assertNumQueries(11):
+                response = self.client.post('/transaction/checkout/', {}, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['transactions']), lines)
+
+    def test_checkout_settles_stock_wallets_and_transactions(self):
+        items = self.fill_cart(3, stock=2, quantity=2)
+        items[0].stock = 5
+        items[0].save()
+
+        response = self.client.post('/transaction/checkout/', {}, format='json')
+
+        self.assertEqual(response.json()['total_amount'], 60.0)
+        self.assertEqual(response.json()['remaining_balance'], 99940.0)
+        self.assertEqual(Transaction.objects.filter(member=self.member).count(), 3)
+        stock = dict(Item.objects.values_list('id', 'stock'))
+        status = dict(Item.objects.values_list('id', 'status'))
+        self.assertEqual(stock[items[0].id], 3)
+        self.assertEqual(status[items[0].id], 'available')
+        self.assertEqual(stock[items[1].id], 0)
+        self.assertEqual(status[items[1].id], 'sold')
+        self.assertEqual(wallet_balance(self.member.pk), Decimal('99940.00'))
+        self.assertEqual(wallet_balance(self.agent.user_id), Decimal('100060.00'))
+        self.assertFalse(CartItem.objects.exists())
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_retried_checkout_replays_the_first_response(self):
+        self.fill_cart(1)
+        first = self.client.post('/transaction/checkout/', {}, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+
+        with self.assertNumQueries(1):
+            retry = self.client.post('/transaction/checkout/', {}, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(wallet_balance(self.member.pk), Decimal('99980.00'))
+        # The same key can't be reused for a different request
+        other = self.client.post('/transaction/checkout/', {'transaction_type': 'sell'}, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(other.status_code, 422)
+
+    def test_retry_after_a_conflict_runs_checkout_again(self):
+        items = self.fill_cart(1, stock=5, quantity=2)
+        with self.sell_meanwhile(items[0], 1):
+            conflict = self.client.post('/transaction/checkout/', {}, format='json', HTTP_IDEMPOTENCY_KEY='k2')
+        self.assertEqual(conflict.status_code, 409)
+
+        retry = self.client.post('/transaction/checkout/', {}, format='json', HTTP_IDEMPOTENCY_KEY='k2')
+
+        self.assertEqual(retry.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', retry.headers)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_oversold_cart_changes_nothing(self):
+        items = self.fill_cart(2, stock=5, quantity=2)
+        Item.objects.filter(id=items[1].id).update(stock=1)
+        StockReservation.objects.update(expires_at=timezone.now())
+
+        response = self.client.post('/transaction/checkout/', {}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Item.objects.get(id=items[0].id).stock, 5)
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(wallet_balance(self.member.pk), Decimal('100000.00'))
+
+    def test_lapsed_line_rechecks_holds_placed_before_it_locks_the_item(self):
+        items = self.fill_cart(1, stock=5, quantity=2)
+        StockReservation.objects.update(expires_at=timezone.now())
+        rival = Cart.objects.create(member=Member.objects.create(username='rival', email='rival@example.com'), agent=self.agent)
+        reads = []
+
+        def read_availability(queryset, cart):
+            # Another cart holds the last units after the first read, before this checkout takes the item lock
+            if reads:
+                hold(rival, items[0], 4)
+            reads.append(cart)
+            return with_available_stock(queryset, cart)
+
+        with mock.patch('transaction.views.with_available_stock', side_effect=read_availability):
+            response = self.client.post('/transaction/checkout/', {}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(reads), 2)
+        self.assertEqual(Item.objects.get(id=items[0].id).stock, 5)
+        self.assertFalse(Transaction.objects.exists())
+
+    def sell_meanwhile(self, item, stock):
+        """Patch the wallet check, which runs between the stock check and the stock update, to sell item's stock down"""
+        def balance(member_id, lock=False):
+            Item.objects.filter(id=item.id).update(stock=stock)
+            return wallet_balance(member_id, lock)
+        return mock.patch('transaction.views.wallet_balance', side_effect=balance)
+
+    def test_stock_sold_during_checkout_rolls_everything_back(self):
+        items = self.fill_cart(2, stock=5, quantity=2)
+
+        with self.sell_meanwhile(items[1], 1):
+            response = self.client.post('/transaction/checkout/', {}, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        # The first line's decrement is undone (the simulated sale shared the rolled-back transaction)
+        self.assertEqual(Item.objects.get(id=items[0].id).stock, 5)
+        self.assertFalse(Item.objects.filter(status='sold').exists())
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(WalletEntry.objects.exclude(kind=WalletEntry.OPENING).count(), 0)
+        self.assertEqual(CartItem.objects.count(), 2)
+        self.assertEqual(StockReservation.objects.count(), 2)
+
+class WalletTests(TestCase):
+    def setUp(self):
+        self.payer = Member.objects.create(username='payer', email='payer@example.com')
+        self.payee = Member.objects.create(username='payee', email='payee@example.com')
+
+    def pay(self, amount):
+        WalletEntry.objects.bulk_create(transfer(self.payer.pk, self.payee.pk, Decimal(amount)))
+
+    def test_balance_is_snapshot_plus_unfolded_entries(self):
+        self.pay('25.50')
+        self.assertEqual(take_snapshots(), 2)
+        self.pay('0.50')
+
+        self.assertEqual(WalletSnapshot.objects.get(member=self.payer).balance, Decimal('99974.50'))
+        self.assertEqual(wallet_balance(self.payer.pk), Decimal('99974.00'))
+        self.assertEqual(wallet_balance(self.payee.pk), Decimal('100026.00'))
+        self.assertEqual(take_snapshots(), 2)
+        self.assertEqual(WalletSnapshot.objects.get(member=self.payer).balance, Decimal('99974.00'))
+        self.assertEqual(take_snapshots(), 0)
+
+    def test_entry_committed_after_a_later_one_was_snapshotted_still_counts(self):
+        # A slow transaction takes its id first but commits after the next payment was snapshotted
+        late = WalletEntry.objects.create(member=self.payer, amount=Decimal('-7.00'), kind=WalletEntry.PAYMENT)
+        WalletEntry.objects.filter(pk=late.pk).delete()
+        self.pay('10.00')
+        self.assertEqual(take_snapshots(), 2)
+        WalletEntry.objects.bulk_create([WalletEntry(id=late.id, member=self.payer, amount=Decimal('-7.00'), kind=WalletEntry.PAYMENT)])
+
+        self.assertEqual(wallet_balance(self.payer.pk), Decimal('99983.00'))
+        self.assertEqual(take_snapshots(), 1)
+        self.assertEqual(WalletSnapshot.objects.get(member=self.payer).balance, Decimal('99983.00'))
+        self.assertEqual(wallet_balance(self.payer.pk), Decimal('99983.00'))
+
+    def test_entries_are_immutable(self):
+        entry = WalletEntry.objects.get(member=self.payer)
+        entry.amount = Decimal('1.00')
+        with self.assertRaises(ValueError):
+            entry.save()
+
+    def test_profile_renders_annotated_wallet_as_string(self):
+        self.pay('0.50')
+        with self.assertNumQueries(2):
+            response = APIClient().get(f'/member/profile/{self.payer.pk}/')
+        self.assertEqual(response.json()['wallet'], '99999.50')
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        seller = Member.objects.create(username='seller', email='seller@example.com')
+        self.agent = Agent.objects.create(user=seller, description='')
+        self.item = Item.objects.create(name='Oil', description='', price=Decimal('10.00'), stock=3, category='waste_oil', agent=self.agent)
+        self.first, self.second = APIClient(), APIClient()
+        self.first.force_authenticate(Member.objects.create(username='first', email='first@example.com'))
+        self.second.force_authenticate(Member.objects.create(username='second', email='second@example.com'))
+
+    def add(self, client, quantity):
+        return client.post('/transaction/cart/add/', {'agent_id': self.agent.id, 'item_id': self.item.id, 'quantity': quantity}, format='json')
+
+    def test_held_units_are_not_available_to_other_carts(self):
+        self.assertEqual(self.add(self.first, 2).status_code, 200)
+        self.assertEqual(self.add(self.second, 2).status_code, 400)
+        self.assertEqual(self.add(self.second, 1).status_code, 200)
+        # A cart's own hold doesn't count against it
+        self.assertEqual(self.first.post('/transaction/cart/edit_quantity/', {'item_id': self.item.id, 'quantity': 2}, format='json').status_code, 200)
+
+    def test_expired_holds_are_ignored_and_swept(self):
+        self.add(self.first, 3)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self.add(self.second, 3).status_code, 200)
+        call_command('release_expired_reservations', stdout=StringIO())
+        self.assertEqual(list(StockReservation.objects.values_list('quantity', flat=True)), [3])
+
+class HistoryTests(TestCase):
+    def setUp(self):
+        self.member = Member.objects.create(username='buyer', email='buyer@example.com')
+        seller = Member.objects.create(username='seller', email='seller@example.com')
+        self.agent = Agent.objects.create(user=seller, description='')
+        item = Item.objects.create(name='Oil', description='', price=Decimal('10.00'), stock=5, category='waste_oil', agent=self.agent)
+        self.transactions = Transaction.objects.bulk_create([
+            Transaction(member=self.member, agent=self.agent, item=item, transaction_type=kind, quantity=1, total_price=Decimal('10.00'))
+            for kind in ('buy', 'sell', 'buy')
+        ])
+        # Two share a timestamp, so the id has to break the tie
+        now = timezone.now()
+        for transaction, created_at in zip(self.transactions, (now - timedelta(days=2), now, now)):
+            Transaction.objects.filter(id=transaction.id).update(created_at=created_at)
+        self.client = APIClient()
+
+    def pages(self, url, **params):
+        ids, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                body = self.client.get(url, {**params, 'limit': 2, **({'cursor': cursor} if cursor else {})}).json()
+            ids += [t['id'] for t in body['transactions']]
+            cursor = body['next_cursor']
+            if cursor is None:
+                return ids
+
+    def test_member_history_pages_newest_first(self):
+        self.client.force_authenticate(self.member)
+        ids = [t.id for t in self.transactions]
+        self.assertEqual(self.pages('/transaction/history/'), [ids[2], ids[1], ids[0]])
+        self.assertEqual(self.pages('/transaction/history/', type='buy'), [ids[2], ids[0]])
+        self.assertEqual(self.pages('/transaction/history/', date_to=str(timezone.localdate() - timedelta(days=1))), [ids[0]])
+        self.assertEqual(self.client.get('/transaction/history/', {'status': 'lost'}).status_code, 400)
+        bad_cursor = encode_cursor(timezone.now().isoformat(), [1])
+        self.assertEqual(self.client.get('/transaction/history/', {'cursor': bad_cursor}).status_code, 400)
+
+    def test_agent_history_mirrors_member_history(self):
+        self.client.force_authenticate(self.agent.user)
+        body = self.client.get('/transaction/history/agent/').json()
+        self.assertEqual([t['member_name'] for t in body['transactions']], ['buyer'] * 3)
+        self.client.force_authenticate(self.member)
+        self.assertEqual(self.client.get('/transaction/history/agent/').status_code, 403)
+
+class OfferChainTests(TestCase):
+    def setUp(self):
+        self.member = Member.objects.create(username='member', email='member@example.com')
+        self.agent = Agent.objects.create(user=Member.objects.create(username='agent', email='agent@example.com'), description='')
+        self.item = Item.objects.create(name='Used oil', description='', price=Decimal('5.00'), stock=20, category='waste_oil', member=self.member)
+        self.client = APIClient()
+        self.client.force_authenticate(self.member)
+
+    def haggle(self, counters):
+        offer = Offer.objects.create(member=self.member, agent=self.agent, item=self.item, quantity=20, price=Decimal('50.00'))
+        for step in range(counters):
+            offer = Offer.objects.create(
+                member=self.member, agent=self.agent, item=self.item, quantity=20,
+                price=Decimal('60.00') + step, sender_is_agent=step % 2 == 1, parent_offer=offer,
+            )
+        return offer
+
+    def test_chain_is_read_in_one_query_whatever_its_length(self):
+        for counters in (1, 8):
+            offer = self.haggle(counters)
+            self.client.force_authenticate(Member.objects.get(pk=self.member.pk))
+            # the user's agent profile, the offer with its item and parties, then the chain
+            with self.assertNumQueries(3):
+                response = self.client.get(f'/transaction/offers/{offer.id}/get-offer-with-messages/')
+            history = response.json()['offer']['negotiation_history']
+            self.assertEqual(len(history), counters + 1)
+            self.assertEqual(history[0]['price'], 50.0)
+            self.assertEqual(history[-1]['id'], offer.id)
+
+    def test_an_answered_offer_cannot_be_answered_again(self):
+        offer = self.haggle(0)
+        self.client.force_authenticate(self.member)
+        counter = self.client.post(f'/transaction/offers/{offer.id}/respond/', {'action': 'counter', 'price': '55'}, format='json')
+        self.assertEqual(counter.status_code, 200)
+        again = self.client.post(f'/transaction/offers/{offer.id}/respond/', {'action': 'counter', 'price': '56'}, format='json')
+        self.assertEqual(again.status_code, 400)
+        self.assertEqual(Offer.objects.get(id=counter.json()['offer_id']).depth, 1)
+
+    def test_inbox_lists_latest_offer_per_thread_with_message_counts(self):
+        countered = self.haggle(2)
+        accepted = self.haggle(0)
+        Offer.objects.filter(id=accepted.id).update(status='accepted')
+        Message.objects.bulk_create([
+            Message(offer=accepted, sender_is_agent=True, content='Pickup on Monday?'),
+            Message(offer=accepted, sender_is_agent=False, content='Yes'),
+            Message(offer=accepted, sender_is_agent=True, content='x' * 300),
+        ])
+        self.client.force_authenticate(Member.objects.get(pk=self.member.pk))
+
+        # the user's agent profile, then each page
+        with self.assertNumQueries(3):
+            first = self.client.get('/transaction/offers/inbox/', {'limit': 1}).json()
+            second = self.client.get('/transaction/offers/inbox/', {'limit': 1, 'cursor': first['next_cursor']}).json()
+
+        thread, older = first['threads'][0], second['threads'][0]
+        self.assertEqual(thread['offer_id'], accepted.id)
+        self.assertEqual((thread['message_count'], thread['unread_count']), (3, 2))
+        self.assertEqual(len(thread['last_message']['preview']), 100)
+        self.assertEqual((older['offer_id'], older['counter_count'], older['last_message']), (countered.id, 2, None))
+        self.assertIsNone(second['next_cursor'])
+
+        # Reading the messages clears the unread count
+        self.client.get(f'/transaction/offers/{accepted.id}/get-offer-with-messages/')
+        self.assertEqual(self.client.get('/transaction/offers/inbox/').json()['threads'][0]['unread_count'], 0)
+
+    @override_settings(SSE_HEARTBEAT=0.01, SSE_MAX_DURATION=1)
+    def test_stream_replays_stored_messages_then_pushes_new_ones(self):
+        offer = self.haggle(0)
+        Offer.objects.filter(id=offer.id).update(status='accepted')
+        seen, _ = Message.objects.bulk_create([
+            Message(offer=offer, sender_is_agent=True, content='Seen'),
+            Message(offer=offer, sender_is_agent=True, content='Missed'),
+        ])
+
+        response = self.client.get(f'/transaction/offers/{offer.id}/messages/stream/', HTTP_LAST_EVENT_ID=str(seen.id), HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = iter(response.streaming_content)
+        self.assertTrue(next(events).startswith(b'retry:'))
+        self.assertIn(b'"content": "Missed"', next(events))
+        self.assertEqual(next(events), b': keep-alive\n\n')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new = Message.objects.create(offer=offer, sender_is_agent=True, content='Live')
+        event = next(events)
+        self.assertTrue(event.startswith(f'id: {new.id}\nevent: message\n'.encode()))
+        self.assertIn(b'"sender": "agent"', event)
+        response.close()
+
+    @override_settings(SSE_MAX_STREAMS=1)
+    def test_streams_past_the_cap_are_refused_until_one_closes(self):
+        offer = self.haggle(0)
+        url = f'/transaction/offers/{offer.id}/messages/stream/'
+
+        first = self.client.get(url, HTTP_ACCEPT='text/event-stream')
+        refused = self.client.get(url, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(refused.status_code, 503)
+        self.assertIn('Retry-After', refused)
+
+        first.close()
+        second = self.client.get(url, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(second.status_code, 200)
+        second.close()
+
+    def test_messages_sync_after_since_id(self):
+        offer = self.haggle(0)
+        Offer.objects.filter(id=offer.id).update(status='accepted')
+        messages = Message.objects.bulk_create([
+            Message(offer=offer, sender_is_agent=i % 2 == 0, content=f'Message {i}') for i in range(5)
+        ])
+        self.client.force_authenticate(Member.objects.get(pk=self.member.pk))
+        url = f'/transaction/offers/{offer.id}/messages/'
+
+        # the user's agent profile, the offer with its parties, the messages, marking them read
+        with self.assertNumQueries(4):
+            body = self.client.get(url, {'since_id': messages[0].id, 'limit': 3}).json()
+        self.assertEqual([m['content'] for m in body['messages']], ['Message 1', 'Message 2', 'Message 3'])
+        self.assertEqual([m['sender'] for m in body['messages']], ['member', 'agent', 'member'])
+        self.assertTrue(body['has_more'])
+
+        body = self.client.get(url, {'since_id': body['last_id'], 'limit': 3}).json()
+        self.assertEqual((body['count'], body['has_more'], body['last_id']), (1, False, messages[4].id))
+        self.assertEqual(self.client.get(url, {'since_id': body['last_id']}).json()['messages'], [])
+
+    def test_accepting_settles_once_and_rejects_competing_offers(self):
+        offer = self.haggle(0)
+        rival_agent = Agent.objects.create(user=Member.objects.create(username='rival', email='rival@example.com'), description='')
+        rival = Offer.objects.create(member=self.member, agent=rival_agent, item=self.item, quantity=20, price=Decimal('70.00'))
+
+        response = self.client.post(f'/transaction/offers/{offer.id}/respond/', {'action': 'accept'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(dict(Offer.objects.values_list('id', 'status')), {offer.id: 'accepted', rival.id: 'rejected'})
+        self.assertEqual(Item.objects.get(id=self.item.id).status, 'sold')
+        self.assertEqual(wallet_balance(self.agent.user_id), Decimal('99950.00'))
+        self.assertEqual(wallet_balance(self.member.pk), Decimal('100050.00'))
+        # The rival offer is closed, so the item can't be sold twice
+        again = self.client.post(f'/transaction/offers/{rival.id}/respond/', {'action': 'accept'}, format='json')
+        self.assertEqual(again.status_code, 400)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_accept_without_funds_changes_nothing(self):
+        offer = self.haggle(0)
+        WalletEntry.objects.bulk_create(transfer(self.agent.user_id, self.member.pk, Decimal('99990.00')))
+
+        response = self.client.post(f'/transaction/offers/{offer.id}/respond/', {'action': 'accept'}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Offer.objects.get(id=offer.id).status, 'pending')
+        self.assertEqual(Item.objects.get(id=self.item.id).status, 'available')
+        self.assertFalse(Transaction.objects.exists())
@@ -10,11 +10,15 @@ urlpatterns = [
     path('checkout/', views.checkout, name='checkout'),
 
     path('history/', views.get_transaction_history, name='get_transaction_history'),
+    path('history/agent/', views.get_agent_transaction_history, name='get_agent_transaction_history'),
     path('<int:transaction_id>/complete/', views.complete_transaction, name='complete_transaction'),
 
     path('offers/create/', views.create_offer, name='create_offer'),
+    path('offers/inbox/', views.offer_inbox, name='offer_inbox'),
     path('offers/<int:offer_id>/respond/', views.respond_to_offer, name='respond_to_offer'),
+    path('offers/<int:offer_id>/messages/', views.get_offer_messages, name='get_offer_messages'),
     path('offers/<int:offer_id>/messages/send/', views.send_message, name='send_message'),
+    path('offers/<int:offer_id>/messages/stream/', views.stream_offer_messages, name='stream_offer_messages'),
     path('offers/<int:offer_id>/get-offer-with-messages/', views.get_offer_with_messages, name='get_offer_with_messages'),
 
     path('offers/latest-accepted/member/<int:member_id>/', views.get_latest_accepted_offer, name='get_latest_accepted_offer_for_member'),
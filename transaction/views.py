@@ -1,19 +1,33 @@
 from django.shortcuts import get_object_or_404
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST, require_GET
 from django.contrib.auth.decorators import login_required
 from member.models import Member, Waste
 from agent.models import Agent
 from item.models import Item
-from .models import Cart, CartItem, Transaction, Offer, Message
+from .models import Cart, CartItem, Transaction, Offer, Message, WalletEntry
+from .chat import MESSAGE_FIELDS, message_events, sender_names, serialize_message
+from .history import history_page
+from .inbox import inbox_offers, inbox_page, mark_read
+from .reservations import hold, release, with_available_stock
+from .settlement import settle_offer
+from .wallet import transfer, wallet_balance
 from django.db import transaction as db_transaction
 from django.views.decorators.csrf import csrf_exempt
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.renderers import JSONRenderer
 from rest_framework.permissions import IsAuthenticated
+from django.db.models import Case, F, Q, Value, When
+from django.conf import settings
 from django.utils import timezone
+from item.feed import invalidate_feed
+from main.events import EventStreamRenderer, stream_slots
+from main.idempotency import idempotent
+from main.pagination import get_page_size
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@db_transaction.atomic
 @csrf_exempt
 def add_to_cart(request):
     member = request.user
@@ -29,8 +43,11 @@ def add_to_cart(request):
     except Agent.DoesNotExist:
         return JsonResponse({"status": "error", "message": "Agent not found."}, status=404)
 
+    # Locking the item queues up concurrent holds on it, so each one sees the others
+    Item.objects.select_for_update().filter(id=item_id).exists()
+    current_cart = Cart.objects.filter(member=member).first()
     try:
-        item = Item.objects.get(id=item_id)
+        item = with_available_stock(Item.objects.all(), current_cart).get(id=item_id)
     except Item.DoesNotExist:
         return JsonResponse(
             {"status": "error", "message": "Item not found."},
@@ -38,9 +55,9 @@ def add_to_cart(request):
         )
     
     # Check stock availability here
-    if quantity > item.stock:
+    if quantity > item.available:
         return JsonResponse(
-            {"status": "error", "message": f"Not enough stock for {item.name}. Available: {item.stock}"},
+            {"status": "error", "message": f"Not enough stock for {item.name}. Available: {item.available}"},
             status=400
         )
 
@@ -57,9 +74,10 @@ def add_to_cart(request):
     
     # When updating existing cart item, check if new total quantity exceeds stock
     new_quantity = quantity if created else cart_item.quantity + quantity
-    if new_quantity > item.stock:
+    if new_quantity > item.available:
+        db_transaction.set_rollback(True)
         return JsonResponse(
-            {"status": "error", "message": f"Cannot add {quantity} more units. Only {item.stock} available in stock."},
+            {"status": "error", "message": f"Cannot add {quantity} more units. Only {item.available} available in stock."},
             status=400
         )
     
@@ -68,6 +86,7 @@ def add_to_cart(request):
     else:
         cart_item.quantity = quantity
     cart_item.save()
+    hold(cart, item, cart_item.quantity)
     return JsonResponse({
         "status": "success", 
         "cart_item_id": cart_item.id,
@@ -95,6 +114,7 @@ def remove_from_cart(request):
         return JsonResponse({"status": "error", "message": "Cart item not found."}, status=404)
     
     cart_item.delete()
+    release(cart, [item_id])
     return JsonResponse({"status": "success", "message": "Item removed from cart."})
 
 @api_view(['GET'])
@@ -108,13 +128,15 @@ def view_cart(request):
         if not cart:
             return JsonResponse({"cart": [], "agent_info": None})
         
+        holds = dict(cart.reservations.filter(expires_at__gt=timezone.now()).values_list("item_id", "expires_at"))
         items = [
             {
                 "item_id": ci.item.id,
                 "item_name": str(ci.item),
                 "quantity": ci.quantity,
                 "price": float(ci.item.price),
-                "total": float(ci.item.price * ci.quantity)
+                "total": float(ci.item.price * ci.quantity),
+                "reserved_until": holds[ci.item_id].isoformat() if ci.item_id in holds else None
             }
             for ci in cart.items.select_related("item")
         ]
@@ -164,6 +186,7 @@ def edit_cart_item_quantity(request):
 
     if new_quantity <= 0:
         cart_item.delete()
+        release(cart, [cart_item.item_id])
         
         remaining_items = cart.items.select_related("item")
         cart_total_price = sum(float(item.item.price * item.quantity) for item in remaining_items)
@@ -175,15 +198,18 @@ def edit_cart_item_quantity(request):
             "item_count": remaining_items.count()
         })
     
-    # Check stock availability
-    if new_quantity > cart_item.item.stock:
+    # Check stock availability, holding off concurrent holds on the item meanwhile
+    Item.objects.select_for_update().filter(id=cart_item.item_id).exists()
+    available = with_available_stock(Item.objects.filter(id=cart_item.item_id), cart).values_list("available", flat=True).get()
+    if new_quantity > available:
         return JsonResponse(
-            {"status": "error", "message": f"Not enough stock. Only {cart_item.item.stock} units available."},
+            {"status": "error", "message": f"Not enough stock. Only {available} units available."},
             status=400
         )
     
     cart_item.quantity = new_quantity
     cart_item.save()
+    hold(cart, cart_item.item, new_quantity)
     
     # Recalculate cart total after quantity update
     cart_items = cart.items.select_related("item")
@@ -212,123 +238,169 @@ def clear_cart(request):
     try:
         cart = Cart.objects.get(member=member)
         cart.items.all().delete()
+        release(cart)
         return JsonResponse({"status": "success", "message": "Cart cleared successfully."})
     except Cart.DoesNotExist:
         return JsonResponse({"status": "error", "message": "Cart not found."}, status=404)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 @db_transaction.atomic
 @csrf_exempt
 def checkout(request):
+    """Settle the member's cart with a fixed number of queries, whatever its size"""
     member = request.user
     transaction_type = request.data.get("transaction_type", "buy")
     
     try:
-        cart = Cart.objects.get(member=member)
+        cart = Cart.objects.select_related("agent").get(member=member)
     except Cart.DoesNotExist:
         return JsonResponse({"status": "error", "message": "Cart not found."}, status=404)
     
     agent = cart.agent  # Agent is already associated with the cart
     
-    cart_items = list(cart.items.select_related("item"))
-    if not cart_items:
+    quantities = dict(cart.items.values_list("item_id", "quantity"))
+    if not quantities:
         return JsonResponse({"status": "error", "message": "Cart is empty."}, status=400)
-
+    
+    # The cart's holds set its units aside, so the items are read without locking them;
+    # a line whose hold lapsed still fits when the stock left by other carts' holds covers it
+    items = with_available_stock(Item.objects.filter(id__in=list(quantities)), cart).in_bulk()
+    lapsed = [item_id for item_id, quantity in quantities.items() if items[item_id].held_for_cart < quantity]
+    if lapsed:
+        # Without a hold the line competes with new holds: take the item locks add_to_cart
+        # places them under, then read again, so no hold can appear between the check and the update
+        list(Item.objects.select_for_update().filter(id__in=lapsed).order_by('id').values_list('id', flat=True))
+        items.update(with_available_stock(Item.objects.filter(id__in=lapsed), cart).in_bulk())
+    
     # Calculate total amount first
     total_amount = 0
-    for ci in cart_items:
-        if not hasattr(ci.item, "price"):
-            return JsonResponse(
-                {"status": "error", "message": f"Item {ci.item.id} has no price."},
-                status=400
-            )
-        
+    for item_id, quantity in quantities.items():
+        item = items[item_id]
         # Double-check stock one more time at checkout for safety
-        if ci.quantity > ci.item.stock:
+        if quantity > item.available:
             return JsonResponse(
-                {"status": "error", "message": f"Not enough stock for {ci.item.name}. Available: {ci.item.stock}"},
+                {"status": "error", "message": f"Not enough stock for {item.name}. Available: {item.available}"},
                 status=400
             )
-            
-        total_price = ci.item.price * ci.quantity
-        total_amount += total_price
+        total_amount += item.price * quantity
+    
+    # Only the paying wallet is locked, so concurrent debits can't overdraw it;
+    # the agent is credited with a plain insert and its row is never touched
+    balance = wallet_balance(member.pk, lock=True)
     
     # Check wallet balance before creating transactions
-    if member.wallet < total_amount:
+    if balance < total_amount:
         return JsonResponse({
             "status": "error", 
-            "message": f"Insufficient wallet balance. Required: {total_amount}, Available: {member.wallet}"
+            "message": f"Insufficient wallet balance. Required: {total_amount}, Available: {balance}"
         }, status=400)
     
-    # Update wallet balances
-    member.wallet -= total_amount
-    agent.user.wallet += total_amount
-    member.save()
-    agent.user.save()
-
-    transactions = []
+    # Decrement every line's stock in one UPDATE; a row only matches while it still has
+    # enough stock, so a short count means another checkout got there first
+    in_stock = Q()
+    for item_id, quantity in quantities.items():
+        in_stock |= Q(id=item_id, stock__gte=quantity)
+    updated = Item.objects.filter(in_stock).update(
+        stock=Case(*[When(id=item_id, then=F("stock") - quantity) for item_id, quantity in quantities.items()]),
+        # Mark item as sold if stock reaches zero
+        status=Case(
+            *[When(id=item_id, stock=quantity, then=Value("sold")) for item_id, quantity in quantities.items()],
+            default=F("status")
+        ),
+        updated_at=timezone.now(),
+    )
+    if updated != len(quantities):
+        db_transaction.set_rollback(True)
+        return JsonResponse({"status": "error", "message": "Stock changed during checkout, please try again."}, status=409)
     
-    for ci in cart_items:
-        total_price = ci.item.price * ci.quantity
-        
-        t = Transaction.objects.create(
+    transactions = Transaction.objects.bulk_create([
+        Transaction(
             member=member,
             agent=agent,
-            item=ci.item,
+            item_id=item_id,
             transaction_type=transaction_type,
-            quantity=ci.quantity,
-            total_price=total_price,
+            quantity=quantity,
+            total_price=items[item_id].price * quantity,
         )
-        
-        # Update item stock
-        ci.item.stock -= ci.quantity
-        
-        # Mark item as sold if stock reaches zero
-        if ci.item.stock <= 0:
-            ci.item.status = 'sold'
-        
-        ci.item.save()
-        
-        transactions.append(t)
+        for item_id, quantity in quantities.items()
+    ])
+    
+    # Record the payments in the wallet ledger
+    if agent.user_id != member.pk:
+        WalletEntry.objects.bulk_create([
+            entry for tr in transactions for entry in transfer(member.pk, agent.user_id, tr.total_price, tr)
+        ])
     
-    # After creating transactions, clear the cart items
+    # After creating transactions, clear the cart items and consume their holds
     cart.items.all().delete()
+    release(cart)
+    
+    # The queryset update above sends no post_save
+    roles = {"agent" if item.member_id else "member" for item in items.values()}
+    db_transaction.on_commit(lambda: invalidate_feed(*roles))
     
     return JsonResponse({
         "status": "success", 
         "message": "Checkout successful!",
         "total_amount": float(total_amount),
         "transactions": [tr.id for tr in transactions],
-        "remaining_balance": float(member.wallet)
+        "remaining_balance": float(balance - total_amount if agent.user_id != member.pk else balance)
     })
 
+def serialize_history_entry(t):
+    return {
+        "id": t.id,
+        "transaction_type": t.transaction_type,
+        "item_name": str(t.item),
+        "quantity": t.quantity,
+        "total_price": float(t.total_price),
+        "status": t.status,
+        "date": t.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "completed_at": t.completed_at.strftime("%Y-%m-%d %H:%M:%S") if t.completed_at else None
+    }
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 @csrf_exempt
 def get_transaction_history(request):
+    """The member's transactions, newest first.
+
+    Query parameters: date_from, date_to, status, type, limit and cursor (the previous page's next_cursor).
+    """
     member = request.user
     
-    # Get all transactions for this member
-    transactions = Transaction.objects.filter(member=member).order_by('-created_at')
-    
-    result = []
-    for t in transactions:
-        result.append({
-            "id": t.id,
-            "transaction_type": t.transaction_type,
-            "item_name": str(t.item),
-            "quantity": t.quantity,
-            "total_price": float(t.total_price),
-            "agent_name": t.agent.user.username,
-            "status": t.status,
-            "date": t.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-            "completed_at": t.completed_at.strftime("%Y-%m-%d %H:%M:%S") if t.completed_at else None
-        })
+    transactions = Transaction.objects.filter(member=member).select_related('item', 'agent__user')
+    try:
+        page, next_cursor = history_page(transactions, request)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
     
     return JsonResponse({
-        "transactions": result,
-        "count": len(result)
+        "transactions": [{**serialize_history_entry(t), "agent_name": t.agent.user.username} for t in page],
+        "count": len(page),
+        "next_cursor": next_cursor
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+def get_agent_transaction_history(request):
+    """The agent's own sales and purchases, newest first; same parameters as get_transaction_history"""
+    if not hasattr(request.user, 'agent'):
+        return JsonResponse({"status": "error", "message": "Only agents have an agent transaction history"}, status=403)
+    
+    transactions = Transaction.objects.filter(agent=request.user.agent).select_related('item', 'member')
+    try:
+        page, next_cursor = history_page(transactions, request)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+    
+    return JsonResponse({
+        "transactions": [{**serialize_history_entry(t), "member_name": t.member.username} for t in page],
+        "count": len(page),
+        "next_cursor": next_cursor
     })
 
 @api_view(['POST'])
@@ -427,6 +499,8 @@ def create_offer(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
+@db_transaction.atomic
 @csrf_exempt
 def respond_to_offer(request, offer_id):
     """Accept, reject, or counter an offer"""
@@ -438,10 +512,12 @@ def respond_to_offer(request, offer_id):
         return JsonResponse({"status": "error", "message": "Invalid action"}, status=400)
     
     try:
+        # Locked until the response is settled, so concurrent answers to it queue up
+        offers = Offer.objects.select_for_update()
         if is_agent:
-            offer = Offer.objects.get(id=offer_id, agent=user.agent)
+            offer = offers.get(id=offer_id, agent=user.agent)
         else:
-            offer = Offer.objects.get(id=offer_id, member=user)
+            offer = offers.get(id=offer_id, member=user)
     except Offer.DoesNotExist:
         return JsonResponse({"status": "error", "message": "Offer not found"}, status=404)
     
@@ -449,6 +525,10 @@ def respond_to_offer(request, offer_id):
     if (is_agent and offer.sender_is_agent) or (not is_agent and not offer.sender_is_agent):
         return JsonResponse({"status": "error", "message": "You cannot respond to your own offer"}, status=403)
     
+    # Each offer is answered once, which keeps a negotiation a single chain
+    if offer.status != 'pending':
+        return JsonResponse({"status": "error", "message": f"This offer has already been {offer.status}"}, status=400)
+    
     if action == 'counter':
         # Handle counter-offer
         new_price = request.data.get('price')
@@ -479,42 +559,24 @@ def respond_to_offer(request, offer_id):
             "offer_id": counter.id
         })
         
-    else:  # accept or reject
-        offer.status = f"{action}ed"  # accepted or rejected
-        offer.save()
+    elif action == 'accept':
+        try:
+            settle_offer(offer)
+        except ValueError as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
         
-        if action == 'accept':
-            # Check wallet balance before creating transaction
-            if offer.agent.user.wallet < offer.price:
-                return JsonResponse({
-                    "status": "error",
-                    "message": f"Insufficient wallet balance. Required: {offer.price}, Available: {offer.agent.user.wallet}"
-                }, status=400)
-            
-            # Update wallet balances
-            offer.agent.user.wallet -= offer.price
-            offer.member.wallet += offer.price
-            offer.agent.user.save()
-            offer.member.save()
-            
-            # Create transaction record
-            Transaction.objects.create(
-                member=offer.member,
-                agent=offer.agent,
-                item=offer.item,  # Now using item directly
-                transaction_type='sell',  # Member selling to agent
-                quantity=int(offer.quantity),  # Converting to int for PositiveIntegerField
-                total_price=offer.price
-            )
-            
-            # Update item status to sold
-            item = offer.item
-            item.status = 'sold'
-            item.save()
+        return JsonResponse({
+            "status": "success",
+            "message": "Offer accepted successfully"
+        })
+    
+    else:
+        offer.status = 'rejected'
+        offer.save(update_fields=['status'])
         
         return JsonResponse({
             "status": "success",
-            "message": f"Offer {action}ed successfully"
+            "message": "Offer rejected successfully"
         })
     
 @api_view(['GET'])
@@ -611,6 +673,87 @@ def send_message(request, offer_id):
         "created_at": message.created_at.strftime("%Y-%m-%d %H:%M:%S")
     })
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+def get_offer_messages(request, offer_id):
+    """The offer's messages after since_id (all of them by default), oldest first, at most limit of them.
+
+    Clients keep the id of the last message they have and ask for the ones after it;
+    has_more tells them to ask again right away.
+    """
+    user = request.user
+    is_agent = hasattr(user, 'agent')
+    
+    try:
+        since_id = int(request.GET.get('since_id') or 0)
+        limit = get_page_size(request)
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "Invalid since_id or limit"}, status=400)
+    
+    try:
+        offers = Offer.objects.select_related('member', 'agent__user')
+        if is_agent:
+            offer = offers.get(id=offer_id, agent=user.agent)
+        else:
+            offer = offers.get(id=offer_id, member=user)
+    except Offer.DoesNotExist:
+        return JsonResponse({"status": "error", "message": "Offer not found or access denied"}, status=404)
+    
+    # One extra row tells us whether there are more
+    rows = list(Message.objects.filter(offer=offer, id__gt=since_id).order_by('id').values(*MESSAGE_FIELDS)[:limit + 1])
+    senders = sender_names(offer)
+    messages = [serialize_message(row, senders) for row in rows[:limit]]
+    if messages:
+        mark_read(offer, is_agent, messages[-1]["id"])
+    
+    return JsonResponse({
+        "status": "success",
+        "messages": messages,
+        "count": len(messages),
+        "last_id": messages[-1]["id"] if messages else since_id,
+        "has_more": len(rows) > limit
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+@csrf_exempt
+def stream_offer_messages(request, offer_id):
+    """Push the offer's messages as Server-Sent Events while the connection stays open.
+
+    Starts after the Last-Event-ID header (sent by reconnecting clients) or the since_id
+    query parameter, replaying the stored messages after it first.
+    """
+    user = request.user
+    is_agent = hasattr(user, 'agent')
+    
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.GET.get('since_id') or 0)
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "Invalid Last-Event-ID or since_id"}, status=400)
+    
+    try:
+        offers = Offer.objects.select_related('member', 'agent__user')
+        if is_agent:
+            offer = offers.get(id=offer_id, agent=user.agent)
+        else:
+            offer = offers.get(id=offer_id, member=user)
+    except Offer.DoesNotExist:
+        return JsonResponse({"status": "error", "message": "Offer not found or access denied"}, status=404)
+    
+    events = stream_slots().claim(message_events(offer, last_id))
+    if events is None:
+        response = JsonResponse({"status": "error", "message": "Too many open streams, try again shortly"}, status=503)
+        response['Retry-After'] = str(settings.SSE_HEARTBEAT)
+        return response
+    
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep proxies (e.g. nginx) from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 @csrf_exempt
@@ -621,44 +764,27 @@ def get_offer_with_messages(request, offer_id):
     
     try:
         # Security check to ensure user is either the member or agent involved
+        offers = Offer.objects.select_related('item', 'member', 'agent__user')
         if is_agent:
-            offer = Offer.objects.get(id=offer_id, agent=user.agent)
+            offer = offers.get(id=offer_id, agent=user.agent)
         else:
-            offer = Offer.objects.get(id=offer_id, member=user)
+            offer = offers.get(id=offer_id, member=user)
             
     except Offer.DoesNotExist:
         return JsonResponse({"status": "error", "message": "Offer not found or access denied"}, status=404)
     
-    # Build negotiation history
-    history = []
-    current = offer
-    
-    # First, collect all parent offers going up the chain
-    parent_chain = []
-    while current.parent_offer:
-        parent_chain.append(current.parent_offer)
-        current = current.parent_offer
-    
-    # Sort history chronologically (oldest to newest)
-    for parent in reversed(parent_chain):
-        history.append({
-            "id": parent.id,
-            "price": float(parent.price),
-            "message": parent.message,
-            "status": parent.status,
-            "sender_is_agent": parent.sender_is_agent,
-            "created_at": parent.created_at.strftime("%Y-%m-%d %H:%M:%S")
-        })
-    
-    # Add the current offer to the history
-    history.append({
-        "id": offer.id,
-        "price": float(offer.price),
-        "message": offer.message,
-        "status": offer.status,
-        "sender_is_agent": offer.sender_is_agent,
-        "created_at": offer.created_at.strftime("%Y-%m-%d %H:%M:%S")
-    })
+    # Build negotiation history, oldest to newest, in one query
+    history = [
+        {
+            "id": step.id,
+            "price": float(step.price),
+            "message": step.message,
+            "status": step.status,
+            "sender_is_agent": step.sender_is_agent,
+            "created_at": step.created_at.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        for step in offer.negotiation_chain()
+    ]
     
     item_info = {
         "id": offer.item.id,
@@ -700,22 +826,65 @@ def get_offer_with_messages(request, offer_id):
     # If offer is accepted, include messages
     if offer.status == 'accepted': 
         # Get all messages
-        messages = Message.objects.filter(offer=offer).order_by('created_at')
-        
-        chat_messages = []
-        for message in messages:
-            sender = offer.agent.user.username if message.sender_is_agent else offer.member.username
-            chat_messages.append({
-                "id": message.id,
-                "content": message.content,
-                "sender": sender,
-                "sender_type": "agent" if message.sender_is_agent else "member",
-                "created_at": message.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-            })
+        senders = sender_names(offer)
+        messages = Message.objects.filter(offer=offer).order_by('id').values(*MESSAGE_FIELDS)
+        chat_messages = [serialize_message(row, senders) for row in messages]
         
         result["messages"] = chat_messages
+        if chat_messages:
+            mark_read(offer, is_agent, chat_messages[-1]["id"])
     
     return JsonResponse({
         "status": "success",
         "offer": result
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+def offer_inbox(request):
+    """The user's negotiations, one row per thread with its latest offer, most recent activity first.
+
+    Query parameters: status (of the latest offer), limit and cursor (the previous page's next_cursor).
+    """
+    user = request.user
+    is_agent = hasattr(user, 'agent')
+    
+    try:
+        page, next_cursor = inbox_page(inbox_offers(user, is_agent), request)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+    
+    threads = []
+    for offer in page:
+        if is_agent:
+            counterparty = {"member": {"id": offer.member.id, "username": offer.member.username}}
+        else:
+            counterparty = {"agent": {"id": offer.agent.id, "name": offer.agent.user.username}}
+        threads.append({
+            "offer_id": offer.id,
+            "thread_id": offer.thread_id,
+            "item": {"id": offer.item.id, "name": offer.item.name},
+            "price": float(offer.price),
+            "quantity": float(offer.quantity),
+            "status": offer.status,
+            "counter_count": offer.depth,
+            # A pending offer from the other side waits for this user's answer
+            "awaiting_response": offer.status == 'pending' and offer.sender_is_agent != is_agent,
+            "message_count": offer.message_count,
+            "unread_count": offer.unread_count,
+            "last_message": {
+                "preview": offer.last_message_preview,
+                "sender_type": "agent" if offer.last_message_from_agent else "member",
+                "created_at": offer.last_message_at.strftime("%Y-%m-%d %H:%M:%S"),
+            } if offer.last_message_at else None,
+            "last_activity": offer.last_activity.strftime("%Y-%m-%d %H:%M:%S"),
+            **counterparty
+        })
+    
+    return JsonResponse({
+        "status": "success",
+        "threads": threads,
+        "count": len(threads),
+        "next_cursor": next_cursor
     })
\ No newline at end of file
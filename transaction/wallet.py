@@ -0,0 +1,81 @@
+from decimal import Decimal
+from django.db import transaction as db_transaction
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from member.models import Member
+from .models import WalletEntry, WalletSnapshot
+
+# Wallets are an append-only ledger: paying someone inserts a debit and a credit
+# WalletEntry rather than rewriting two balances, so payments to a busy agent never
+# queue up on its row. Balances are read as the latest snapshot plus the entries not
+# folded into it; the snapshot_wallets command folds entries into new snapshots.
+#
+# Entries are marked folded one by one rather than up to some id: ids are handed out
+# when a row is inserted, not when its transaction commits, so an entry can become
+# visible after a higher-numbered one was already snapshotted. It stays unfolded, and
+# counted in the tail, until a later run folds it.
+
+OPENING_BALANCE = Decimal('100000.00')
+SNAPSHOT_BATCH_SIZE = 1000
+
+def _latest_snapshot(member):
+    return WalletSnapshot.objects.filter(member=member).order_by('-last_entry')
+
+def with_wallet_balance(members):
+    """Annotate members with balance: their latest snapshot plus the sum of their unfolded entries"""
+    zero = Value(Decimal('0'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    tail = (
+        WalletEntry.objects.filter(member=OuterRef('pk'), folded=False)
+        .values('member').annotate(total=Sum('amount')).values('total')
+    )
+    snapshot = Subquery(_latest_snapshot(OuterRef('pk')).values('balance')[:1])
+    return members.annotate(balance=Coalesce(snapshot, zero) + Coalesce(Subquery(tail), zero))
+
+def wallet_balance(member_id, lock=False):
+    """
+    Current balance of a wallet. With lock=True the member's row is locked until the
+    end of the transaction, which serializes debits so a wallet can't be overdrawn.
+    """
+    members = Member.objects.filter(pk=member_id)
+    if lock:
+        members = members.select_for_update()
+    return with_wallet_balance(members).values_list('balance', flat=True).get()
+
+def transfer(payer_id, payee_id, amount, transaction=None):
+    """The (unsaved) debit and credit entries moving amount from payer to payee; bulk_create them"""
+    return [
+        WalletEntry(member_id=payer_id, amount=-amount, kind=WalletEntry.PAYMENT, transaction=transaction),
+        WalletEntry(member_id=payee_id, amount=amount, kind=WalletEntry.RECEIPT, transaction=transaction),
+    ]
+
+def open_wallet(member, amount=OPENING_BALANCE):
+    WalletEntry.objects.create(member=member, amount=amount, kind=WalletEntry.OPENING)
+
+def take_snapshots():
+    """Snapshot every wallet with unfolded entries; returns how many were taken"""
+    member_ids = list(WalletEntry.objects.filter(folded=False).order_by().values_list('member_id', flat=True).distinct())
+    for start in range(0, len(member_ids), SNAPSHOT_BATCH_SIZE):
+        batch = member_ids[start:start + SNAPSHOT_BATCH_SIZE]
+        with db_transaction.atomic():
+            # Exactly the entries read here are folded; a concurrent run waits for their locks and then skips them
+            entries = list(
+                WalletEntry.objects.select_for_update().filter(member_id__in=batch, folded=False)
+                .values_list('id', 'member_id', 'amount')
+            )
+            snapshots = {
+                member_id: (balance, last_entry) for member_id, balance, last_entry in
+                WalletSnapshot.objects.filter(member_id__in=batch).order_by('last_entry').values_list('member_id', 'balance', 'last_entry')
+            }
+            for entry_id, member_id, amount in entries:
+                balance, last_entry = snapshots.get(member_id, (Decimal('0'), 0))
+                snapshots[member_id] = (balance + amount, max(last_entry, entry_id))
+            entry_ids = [entry_id for entry_id, _, _ in entries]
+            for chunk in range(0, len(entry_ids), SNAPSHOT_BATCH_SIZE):
+                WalletEntry.objects.filter(id__in=entry_ids[chunk:chunk + SNAPSHOT_BATCH_SIZE]).update(folded=True)
+            # Only the latest snapshot is ever read
+            WalletSnapshot.objects.filter(member_id__in=batch).delete()
+            WalletSnapshot.objects.bulk_create([
+                WalletSnapshot(member_id=member_id, balance=balance, last_entry=last_entry)
+                for member_id, (balance, last_entry) in snapshots.items()
+            ])
+    return len(member_ids)